@@ -74,6 +74,37 @@ def get_sys_latency(nphases, cas_latency):
 def get_sys_phase(nphases, sys_latency, cas_latency):
     return sys_latency*nphases - cas_latency
 
+def tree_reduce(op, seq):
+    """reduce() with a balanced tree instead of a left-linear chain
+
+    For associative operators on signals this is semantics-preserving but
+    gives logarithmic instead of linear combinational depth.
+    """
+    seq = list(seq)
+    if len(seq) == 1:
+        return seq[0]
+    mid = len(seq)//2
+    return op(tree_reduce(op, seq[:mid]), tree_reduce(op, seq[mid:]))
+
+def tree_reduce_signals(module, op, seq):
+    """tree_reduce with an explicit Signal per tree node
+
+    Materialising each level in a named comb signal pins the balanced
+    structure down so the synthesizer cannot re-associate it back into a
+    linear chain; use for single-bit reductions on critical paths.
+    """
+    seq = list(seq)
+    while len(seq) > 1:
+        level = []
+        for a, b in zip(seq[0::2], seq[1::2]):
+            node = Signal()
+            module.comb += node.eq(op(a, b))
+            level.append(node)
+        if len(seq) % 2:
+            level.append(seq[-1])
+        seq = level
+    return seq[0]
+
 # PHY Pads Transformers ----------------------------------------------------------------------------
 
 class PHYPadsReducer:
@@ -318,10 +349,18 @@ class TMRRecord(Record):
         except:
             return getattr(object.__getattribute__(self, "payload"), name)
         
+def maj3(a, b, c):
+    """Bitwise 2-of-3 majority vote"""
+    return (a & b) | (b & c) | (a & c)
+
 class TMRInput(Module):
     def __init__(self, tmr_signal, control_signal=None):
-        sig_length = int(len(tmr_signal) / 3)
-    
+        # The packed bus must hold exactly three copies; a non-triplicated
+        # source would make the vote below silently mix unrelated bits.
+        assert len(tmr_signal) % 3 == 0, \
+            "TMRInput expects a 3x-wide packed bus, got {} bits".format(len(tmr_signal))
+        sig_length = len(tmr_signal) // 3
+
         self.control = Signal(sig_length)
         self.unanimous = Signal()
         self.TMR = tmr_signal
@@ -514,6 +553,51 @@ class tXXDController(Module):
                 )
 
 
+class tXXDControllerTMR(Module):
+    """tXXDController with triplicated state registers
+
+    Same interface and behavior as tXXDController, but the counter and ready
+    registers are kept in three copies whose next state is computed from the
+    majority-voted value, so a single upset in any copy heals on the next
+    cycle. The valid input and ready output are single wires: with a shared
+    (already voted) input, triplicating the surrounding combinational logic
+    adds no fault coverage over triplicating the state alone.
+    """
+    def __init__(self, txxd):
+        self.valid = valid = Signal()
+        self.ready = ready = Signal(reset=txxd is None)
+        ready.attr.add("no_retiming")
+
+        # # #
+
+        if txxd is not None:
+            counts = [Signal(max=max(txxd, 2)) for _ in range(3)]
+            readys = [Signal() for _ in range(3)]
+            count_v = Signal(max=max(txxd, 2))
+            self.comb += [
+                count_v.eq(maj3(*counts)),
+                ready.eq(maj3(*readys))
+            ]
+            for count, rdy in zip(counts, readys):
+                self.sync += \
+                    If(valid,
+                        count.eq(txxd - 1),
+                        If((txxd - 1) == 0,
+                            rdy.eq(1)
+                        ).Else(
+                            rdy.eq(0)
+                        )
+                    ).Elif(~ready,
+                        count.eq(count_v - 1),
+                        If(count_v == 1,
+                            rdy.eq(1)
+                        )
+                    ).Else(
+                        count.eq(count_v),
+                        rdy.eq(ready)
+                    )
+
+
 class tFAWController(Module):
     def __init__(self, tfaw):
         self.valid = valid = Signal()
@@ -535,3 +619,46 @@ class tFAWController(Module):
                         ready.eq(1)
                     )
                 )
+
+
+class tFAWControllerTMR(Module):
+    """tFAWController with a triplicated activate window
+
+    The sliding window of activates is the only state; keep three copies fed
+    from the majority-voted window so an upset in one copy is scrubbed as the
+    window shifts. The popcount and ready logic run once on the voted value.
+    """
+    def __init__(self, tfaw):
+        self.valid = valid = Signal()
+        self.ready = ready = Signal(reset=1)
+        ready.attr.add("no_retiming")
+
+        # # #
+
+        if tfaw is not None:
+            windows  = [Signal(tfaw) for _ in range(3)]
+            window_v = Signal(tfaw)
+            self.comb += window_v.eq(maj3(*windows))
+            for window in windows:
+                self.sync += window.eq(Cat(valid, window_v))
+
+            count  = Signal(max=max(tfaw, 2))
+            self.comb += count.eq(reduce(add, [window_v[i] for i in range(tfaw)]))
+
+            readys  = [Signal(reset=1) for _ in range(3)]
+            ready_v = Signal()
+            self.comb += [
+                ready_v.eq(maj3(*readys)),
+                ready.eq(ready_v)
+            ]
+            for rdy in readys:
+                self.sync += \
+                    If(count < 4,
+                        If(count == 3,
+                            rdy.eq(~valid)
+                        ).Else(
+                            rdy.eq(1)
+                        )
+                    ).Else(
+                        rdy.eq(ready_v)
+                    )
@@ -10,6 +10,7 @@
 import math
 
 from migen import *
+from migen.genlib.coding import PriorityEncoder
 
 from litex.soc.interconnect import stream
 from litex.soc.interconnect.csr import *
@@ -18,9 +19,17 @@ from litedram.common import *
 from litedram.core.multiplexer import *
 from litedram.core.logging import *
 
+from collections import namedtuple
 from functools import reduce
 from operator import or_, and_
 
+# Lookahead FIFO + single-entry buffer pair created by BankMachine.make_buffer.
+_CmdBuffer = namedtuple("_CmdBuffer", ["lookahead", "buffer"])
+
+# Shadow storage copy mirroring a _CmdBuffer, created by BankMachine.make_shadow.
+_ShadowCopy = namedtuple("_ShadowCopy",
+    ["look_addr", "look_valid", "buf_addr", "buf_valid", "buf_we"])
+
 # AddressSlicer ------------------------------------------------------------------------------------
 
 class _AddressSlicer:
@@ -41,8 +50,130 @@ class _AddressSlicer:
         split = self.colbits - self.address_align
         return Cat(Replicate(0, self.address_align), address[:split])
 
+# BankMachineFSM -----------------------------------------------------------------------------------
+
+class _BankMachineFSM(Module):
+    """Control and command generation FSM of a BankMachine
+
+    The FSM lives in its own module (rather than inlined in BankMachine) so
+    that synthesis tools can recognize it and apply optimized state encodings
+    per bank; most tools only run FSM extraction when the state registers sit
+    in a dedicated module.
+
+    All signals are provided by the parent BankMachine: `cmd`/`req` are its
+    command/request endpoints, `buf_*`/`row_*` reflect the (voted) command
+    buffer and row-tracking state, and `twtp_ready`/`trc_ready` come from the
+    timing controllers (tRC >= tRAS per JEDEC, so tRC readiness also covers
+    the activate-to-precharge interval).
+    """
+    def __init__(self, settings, cmd, req, refresh_req, refresh_gnt, fsm_state,
+                 buf_valid, buf_we, row_opened, row_hit, auto_precharge,
+                 row_open, row_close, row_col_n_addr_sel,
+                 twtp_ready, trc_ready):
+        # Note: tRRD, tFAW, tCCD, tWTR timings are enforced by the multiplexer
+        self.submodules.fsm = fsm = FSM()
+
+        # The TRP and TRCD delays share a single down-counter and DELAY state instead of the
+        # state-per-cycle chains that delayed_enter would generate.
+        delay_cnt        = Signal(max=max(settings.timing.tRP, settings.timing.tRCD, 2))
+        delay_to_regular = Signal() # DELAY exit: 0 = ACTIVATE (tRP), 1 = REGULAR (tRCD)
+
+        def enter_delayed(target, delay):
+            if delay == 0:
+                return [NextState(target)]
+            return [
+                NextValue(delay_cnt, delay - 1),
+                NextValue(delay_to_regular, target == "REGULAR"),
+                NextState("DELAY")
+            ]
+        fsm.act("REGULAR",
+            fsm_state.eq(0),
+            If(refresh_req,
+                NextState("REFRESH")
+            ).Elif(buf_valid,
+                If(row_opened,
+                    If(row_hit,
+                        cmd.valid.eq(1),
+                        If(buf_we,
+                            req.wdata_ready.eq(cmd.ready),
+                            cmd.is_write.eq(1),
+                            cmd.we.eq(1),
+                        ).Else(
+                            req.rdata_valid.eq(cmd.ready),
+                            cmd.is_read.eq(1)
+                        ),
+                        cmd.cas.eq(1),
+                        *([If(cmd.ready & auto_precharge,
+                           NextState("AUTOPRECHARGE")
+                        )] if settings.with_auto_precharge else [])
+                    ).Else(  # row_opened & ~row_hit
+                        NextState("PRECHARGE")
+                    )
+                ).Else(  # ~row_opened
+                    NextState("ACTIVATE")
+                )
+            )
+        )
+        fsm.act("PRECHARGE",
+            fsm_state.eq(1),
+            # Note: we are presenting the column address, A10 is always low
+            If(twtp_ready & trc_ready,
+                cmd.valid.eq(1),
+                If(cmd.ready,
+                    *enter_delayed("ACTIVATE", settings.timing.tRP - 1)
+                ),
+                cmd.ras.eq(1),
+                cmd.we.eq(1),
+                cmd.is_cmd.eq(1)
+            ),
+            row_close.eq(1)
+        )
+        if settings.with_auto_precharge:
+            fsm.act("AUTOPRECHARGE",
+                fsm_state.eq(2),
+                If(twtp_ready & trc_ready,
+                    *enter_delayed("ACTIVATE", settings.timing.tRP - 1)
+                ),
+                row_close.eq(1)
+            )
+        fsm.act("ACTIVATE",
+            fsm_state.eq(3),
+            If(trc_ready,
+                row_col_n_addr_sel.eq(1),
+                row_open.eq(1),
+                cmd.valid.eq(1),
+                cmd.is_cmd.eq(1),
+                If(cmd.ready,
+                    *enter_delayed("REGULAR", settings.timing.tRCD - 1)
+                ),
+                cmd.ras.eq(1)
+            )
+        )
+        fsm.act("REFRESH",
+            fsm_state.eq(4),
+            If(twtp_ready,
+                refresh_gnt.eq(1),
+            ),
+            row_close.eq(1),
+            cmd.is_cmd.eq(1),
+            If(~refresh_req,
+                NextState("REGULAR")
+            )
+        )
+        fsm.act("DELAY",
+            If(delay_cnt == 0,
+                If(delay_to_regular,
+                    NextState("REGULAR")
+                ).Else(
+                    NextState("ACTIVATE")
+                )
+            ).Else(
+                NextValue(delay_cnt, delay_cnt - 1)
+            )
+        )
+
 # BankMachine --------------------------------------------------------------------------------------
-      
+
 class BankMachine(Module, AutoCSR):
     """Converts requests from ports into DRAM commands
 
@@ -61,11 +192,10 @@ class BankMachine(Module, AutoCSR):
     settings).
 
     Lock (cmd_layout.lock) is used to synchronise with LiteDRAMCrossbar. It is
-    being held when:
-     - there is a valid command awaiting in `cmd_buffer_lookahead` - this buffer
-       becomes ready simply when the next data gets fetched to the `cmd_buffer`
-     - there is a valid command in `cmd_buffer` - `cmd_buffer` becomes ready
-       when the BankMachine sends wdata_ready/rdata_valid back to the crossbar
+    asserted once `max_pending` transfers are in flight, i.e. accepted on
+    `req` but not yet completed with wdata_ready/rdata_valid; below that the
+    port is free to dispatch to other BankMachines while prior transfers
+    drain.
 
     Parameters
     ----------
@@ -173,31 +303,30 @@ class BankMachine(Module, AutoCSR):
         
         log_message = Cat(log_addr, log_num, log_n)
         
-        message, ready, request = logger.get_log_port()
+        message, ready, request = logger.get_log_port(source_id=n)
         
-        # Connect log message
-        self.comb += [message.eq(log_message)]
+        # Register the log message when the logger grants this bank, so only
+        # the winning bank drives the shared fabric in a given cycle
+        self.sync += If(request & ready, message.eq(log_message))
         
         # Send message based on priority
-        statement = None
-        for log_sig, log_code in zip(log_sigs, log_codes):
-            if statement is not None:
-                statement = statement.Elif(log_sig, log_num.eq(log_code))
-            else:
-                statement = If(log_sig, log_num.eq(log_code))
-        self.comb += statement
-            
-        # Confirm message based on priority
-        statement = None
-        for log_sig, log_code in zip(log_sigs, log_codes):
-            if statement is not None:
-                statement = statement.Elif(log_sig, log_sig.eq(0))
-            else:
-                statement = If(log_sig, log_sig.eq(0))
-        self.sync += If(ready, statement)
-                
+        log_pe = PriorityEncoder(len(log_sigs))
+        self.submodules += log_pe
+        self.comb += [
+            log_pe.i.eq(Cat(*log_sigs)),
+            If(~log_pe.n, log_num.eq(Array(log_codes)[log_pe.o]))
+        ]
+
+        # Confirm message: one-hot clear of the confirmed bit, so each
+        # log_sig's clock enable depends only on the encoder output instead of
+        # every higher-priority log_sig
+        log_clear = Signal(len(log_sigs))
+        self.comb += If(ready & ~log_pe.n, log_clear.eq(1 << log_pe.o))
+        for i, log_sig in enumerate(log_sigs):
+            self.sync += If(log_clear[i], log_sig.eq(0))
+
         # Request when waiting for any log message
-        self.comb += request.eq(reduce(or_, log_sigs))
+        self.comb += request.eq(~log_pe.n)
         
         # TMR Setup --------------------------------------------------------------------------------
         
@@ -207,40 +336,153 @@ class BankMachine(Module, AutoCSR):
         
         cmd_buffer_layout    = [("we", 1), ("addr", len(req.addr))]
         
+        # Buffered FIFOs register their output, which lets the tools map
+        # the storage to block RAM; shallow FIFOs stay in LUTRAM.
+        buffered = settings.cmd_buffer_buffered or \
+            (settings.cmd_buffer_bram and settings.cmd_buffer_depth >= 16)
+
         def make_buffer():
             cmd_buffer_lookahead = stream.SyncFIFO(
                 cmd_buffer_layout, settings.cmd_buffer_depth,
-                buffered=settings.cmd_buffer_buffered)
-                
+                buffered=buffered)
+
             cmd_buffer = stream.Buffer(cmd_buffer_layout) # 1 depth buffer to detect row change
-            
+
             self.submodules += cmd_buffer_lookahead, cmd_buffer
-            
+
             self.comb += [
                 req.connect(cmd_buffer_lookahead.sink, keep={"valid", "we", "addr"}),
                 cmd_buffer_lookahead.source.connect(cmd_buffer.sink),
                 cmd_buffer.source.ready.eq(req.wdata_ready | req.rdata_valid),
             ]
-            return (cmd_buffer_lookahead, cmd_buffer)
-            
+            return _CmdBuffer(cmd_buffer_lookahead, cmd_buffer)
+
         cmd_buffer_lookahead, cmd_buffer = make_buffer()
-        cmd_buffer_lookahead2, cmd_buffer2 = make_buffer()
-        cmd_buffer_lookahead3, cmd_buffer3 = make_buffer()
-        
-        
-        lockSig = Cat(cmd_buffer_lookahead.source.valid | cmd_buffer.source.valid, 
-                        cmd_buffer_lookahead2.source.valid | cmd_buffer2.source.valid, 
-                        cmd_buffer_lookahead3.source.valid | cmd_buffer3.source.valid)
-        self.submodules += TMRInput(lockSig, req.lock)
-        
+
+        # The handshake control is shared, but the queued payload and the
+        # valid/payload output registers are storage - the dominant SEU
+        # cross-section - so two shadow copies mirror them from the stream
+        # handshakes alone and the voters below compare three independent
+        # read-port outputs. A shadow only shares the FIFO pointer logic's
+        # *decisions* (the sink/source handshakes), never its state.
+        def make_shadow():
+            depth = settings.cmd_buffer_depth
+            width = len(req.addr) + 1 # we + addr, we at bit 0
+            storage = Memory(width, depth)
+            wrport  = storage.get_port(write_capable=True)
+            rdport  = storage.get_port(async_read=True)
+            self.specials += storage, wrport, rdport
+
+            sink   = cmd_buffer_lookahead.sink
+            source = cmd_buffer_lookahead.source
+
+            produce = Signal(max=depth)
+            consume = Signal(max=depth)
+            level   = Signal(max=depth + 1)
+
+            def ptr_inc(ptr):
+                return If(ptr == depth - 1, ptr.eq(0)).Else(ptr.eq(ptr + 1))
+
+            do_write = sink.valid & sink.ready
+            self.comb += [
+                wrport.adr.eq(produce),
+                wrport.dat_w.eq(Cat(sink.we, sink.addr)),
+                wrport.we.eq(do_write),
+                rdport.adr.eq(consume)
+            ]
+            self.sync += If(do_write, ptr_inc(produce))
+
+            look_valid = Signal()
+            look_we    = Signal()
+            look_addr  = Signal(len(req.addr))
+            if buffered:
+                # Mirror SyncFIFOBuffered's extra output register stage: an
+                # entry leaves the shadow memory into out_data one cycle
+                # before it is consumed on the stream, exactly when the real
+                # FIFO moves it into its output register.
+                out_valid = Signal()
+                out_data  = Signal(width)
+                shadow_re = Signal()
+                self.comb += shadow_re.eq((level != 0) & (~out_valid | source.ready))
+                self.sync += [
+                    If(do_write & ~shadow_re,
+                        level.eq(level + 1)
+                    ).Elif(shadow_re & ~do_write,
+                        level.eq(level - 1)
+                    ),
+                    If(shadow_re, ptr_inc(consume)),
+                    If(shadow_re,
+                        out_valid.eq(1),
+                        out_data.eq(rdport.dat_r)
+                    ).Elif(source.ready,
+                        out_valid.eq(0)
+                    )
+                ]
+                self.comb += [
+                    look_valid.eq(out_valid),
+                    look_we.eq(out_data[0]),
+                    look_addr.eq(out_data[1:])
+                ]
+            else:
+                # First-word-fall-through: the oldest entry is visible on the
+                # asynchronous read port as long as the shadow is non-empty.
+                do_read = source.valid & source.ready
+                self.sync += [
+                    If(do_write & ~do_read,
+                        level.eq(level + 1)
+                    ).Elif(do_read & ~do_write,
+                        level.eq(level - 1)
+                    ),
+                    If(do_read, ptr_inc(consume))
+                ]
+                self.comb += [
+                    look_valid.eq(level != 0),
+                    look_we.eq(rdport.dat_r[0]),
+                    look_addr.eq(rdport.dat_r[1:])
+                ]
+
+            # Mirror of cmd_buffer's PipeValid registers (loaded on sink.ready)
+            buf_valid = Signal()
+            buf_we    = Signal()
+            buf_addr  = Signal(len(req.addr))
+            self.sync += If(cmd_buffer.sink.ready,
+                buf_valid.eq(look_valid),
+                buf_we.eq(look_we),
+                buf_addr.eq(look_addr)
+            )
+            return _ShadowCopy(look_addr, look_valid, buf_addr, buf_valid, buf_we)
+
+        shadow2 = make_shadow()
+        shadow3 = make_shadow()
+
+
+        # Hold the crossbar port only once `max_pending` requests are in flight, so the port can
+        # dispatch to other BankMachines while prior transfers drain.
+        pending_xfers = Signal(max=settings.cmd_buffer_depth + 2)
+        xfer_start = Signal()
+        xfer_done  = Signal()
+        self.comb += [
+            xfer_start.eq(req.valid & req.ready),
+            xfer_done.eq(req.wdata_ready | req.rdata_valid)
+        ]
+        self.sync += \
+            If(xfer_start & ~xfer_done,
+                pending_xfers.eq(pending_xfers + 1)
+            ).Elif(~xfer_start & xfer_done,
+                pending_xfers.eq(pending_xfers - 1)
+            )
+        self.comb += req.lock.eq(pending_xfers >= settings.max_pending)
+
         #Vote req ready
-        readySig = cmd_buffer_lookahead.sink.ready & cmd_buffer_lookahead2.sink.ready & cmd_buffer_lookahead3.sink.ready
+        readySig = cmd_buffer_lookahead.sink.ready
         self.comb += req.ready.eq(readySig)
-        
-        #Vote lookahead addr
-        lookAddrSig = Cat(cmd_buffer_lookahead.source.addr, cmd_buffer_lookahead2.source.addr, cmd_buffer_lookahead3.source.addr)
-        lookAddrVote = TMRInput(lookAddrSig)
-        self.submodules += lookAddrVote
+
+        #Vote lookahead addr (only used by the auto-precharge compare)
+        if settings.with_auto_precharge:
+            lookAddrSig = Cat(cmd_buffer_lookahead.source.addr,
+                              shadow2.look_addr, shadow3.look_addr)
+            lookAddrVote = TMRInput(lookAddrSig)
+            self.submodules += lookAddrVote
         
         #Vote buffer addr
         self.create_addr_errors = CSRStorage()
@@ -248,14 +490,13 @@ class BankMachine(Module, AutoCSR):
         self.submodules.addr_error_timer = addr_error_timer = tXXDController(settings.addr_error_time)
         self.comb += addr_error_timer.valid.eq(addr_error_timer.ready)
         
-        addr_error = Signal(len(req.addr))
-        self.comb += If(self.create_addr_errors.storage & addr_error_timer.ready, addr_error.eq(-1)).Else(addr_error.eq(0))
-        #self.comb += If(self.create_addr_errors.w, addr_error.eq(-1)).Else(addr_error.eq(0))
-        
+        inject = Signal()
+        self.comb += inject.eq(self.create_addr_errors.storage & addr_error_timer.ready)
+
         buffer_addr = Signal(len(cmd_buffer.source.addr))
-        self.comb += buffer_addr.eq(cmd_buffer.source.addr ^ addr_error)
+        self.comb += If(inject, buffer_addr.eq(~cmd_buffer.source.addr)).Else(buffer_addr.eq(cmd_buffer.source.addr))
         
-        bufAddrSig = Cat(buffer_addr, cmd_buffer2.source.addr, cmd_buffer3.source.addr)
+        bufAddrSig = Cat(buffer_addr, shadow2.buf_addr, shadow3.buf_addr)
         bufAddrVote = TMRInput(bufAddrSig)
         self.submodules += bufAddrVote
         
@@ -268,38 +509,52 @@ class BankMachine(Module, AutoCSR):
                       log_addr[15:].eq(bufAddrVote.control[7:]),
                       log_addr[30].eq(1)]
         
-        #Vote lookahead valid
-        lookValidSig = Cat(cmd_buffer_lookahead.source.valid, cmd_buffer_lookahead2.source.valid, cmd_buffer_lookahead3.source.valid)
-        lookValidVote = TMRInput(lookValidSig)
-        self.submodules += lookValidVote
-        
+        #Vote lookahead valid (only used by the auto-precharge compare)
+        if settings.with_auto_precharge:
+            lookValidSig = Cat(cmd_buffer_lookahead.source.valid,
+                               shadow2.look_valid, shadow3.look_valid)
+            lookValidVote = TMRInput(lookValidSig)
+            self.submodules += lookValidVote
+
         #Vote buffer valid
-        bufValidSig = Cat(cmd_buffer.source.valid, cmd_buffer2.source.valid, cmd_buffer3.source.valid)
+        bufValidSig = Cat(cmd_buffer.source.valid, shadow2.buf_valid, shadow3.buf_valid)
         bufValidVote = TMRInput(bufValidSig)
         self.submodules += bufValidVote
-        
-        log_rising_edge(log_valid_vote, ~(cmd_buffer.source.valid == cmd_buffer2.source.valid == cmd_buffer3.source.valid))
-        
+
+        log_rising_edge(log_valid_vote, ~bufValidVote.unanimous)
+
         #Vote buffer we
-        bufWeSig = Cat(cmd_buffer.source.we, cmd_buffer2.source.we, cmd_buffer3.source.we)
+        bufWeSig = Cat(cmd_buffer.source.we, shadow2.buf_we, shadow3.buf_we)
         bufWeVote = TMRInput(bufWeSig)
         self.submodules += bufWeVote
 
         # Row tracking -----------------------------------------------------------------------------
         slicer = _AddressSlicer(settings.geom.colbits, address_align)
-        
+
+        # Slice the voted addresses once and fan the results out to the row
+        # tracking, address generation and auto-precharge compare below.
+        buf_row  = Signal(settings.geom.rowbits)
+        buf_col  = Signal(settings.geom.colbits)
+        self.comb += [
+            buf_row.eq(slicer.row(bufAddrVote.control)),
+            buf_col.eq(slicer.col(bufAddrVote.control)),
+        ]
+        if settings.with_auto_precharge:
+            look_row = Signal(settings.geom.rowbits)
+            self.comb += look_row.eq(slicer.row(lookAddrVote.control))
+
         row        = Signal(settings.geom.rowbits)
         row_opened = Signal()
         row_hit    = Signal()
         row_open   = Signal()
         row_close  = Signal()
-        self.comb += row_hit.eq(row == slicer.row(bufAddrVote.control))
+        self.comb += row_hit.eq(row == buf_row)
         self.sync += \
             If(row_close,
                 row_opened.eq(0)
             ).Elif(row_open,
                 row_opened.eq(1),
-                row.eq(slicer.row(bufAddrVote.control))
+                row.eq(buf_row)
             )
 
         # Address generation -----------------------------------------------------------------------
@@ -307,142 +562,54 @@ class BankMachine(Module, AutoCSR):
         self.comb += [
             cmd.ba.eq(n),
             If(row_col_n_addr_sel,
-                cmd.a.eq(slicer.row(bufAddrVote.control))
+                cmd.a.eq(buf_row)
             ).Else(
-                cmd.a.eq((auto_precharge << 10) | slicer.col(bufAddrVote.control)) # Vote addr
+                # A10 requests auto-precharge; tied low when the feature is disabled
+                cmd.a.eq((auto_precharge << 10) | buf_col if settings.with_auto_precharge
+                         else buf_col) # Vote addr
             )
         ]
 
+        # Shared command-accepted strobe arming the timing controllers below
+        cmd_fire = Signal()
+        self.comb += cmd_fire.eq(cmd.valid & cmd.ready)
+
         # tWTP (write-to-precharge) controller -----------------------------------------------------
         write_latency = math.ceil(settings.phy.cwl / settings.phy.nphases)
         precharge_time = write_latency + settings.timing.tWR + settings.timing.tCCD # AL=0
         self.submodules.twtpcon = twtpcon = tXXDController(precharge_time)
-        self.comb += twtpcon.valid.eq(cmd.valid & cmd.ready & cmd.is_write)
-        
-        self.submodules.twtpcon2 = twtpcon2 = tXXDController(precharge_time)
-        self.comb += twtpcon2.valid.eq(cmd.valid & cmd.ready & cmd.is_write)
-        
-        self.submodules.twtpcon3 = twtpcon3 = tXXDController(precharge_time)
-        self.comb += twtpcon3.valid.eq(cmd.valid & cmd.ready & cmd.is_write)
-        
-        twtpSig = Cat(twtpcon.ready, twtpcon2.ready, twtpcon3.ready)
-        twtpVote = TMRInput(twtpSig)
-        self.submodules += twtpVote
+        self.comb += twtpcon.valid.eq(cmd_fire & cmd.is_write)
 
         # tRC (activate-activate) controller -------------------------------------------------------
+        # tRC >= tRAS (JEDEC), so this counter also enforces the activate-to-precharge interval
+        # and a separate tRAS controller is not needed.
+        if settings.timing.tRC is not None and settings.timing.tRAS is not None:
+            assert settings.timing.tRC >= settings.timing.tRAS
         self.submodules.trccon = trccon = tXXDController(settings.timing.tRC)
-        self.comb += trccon.valid.eq(cmd.valid & cmd.ready & row_open)
-        
-        self.submodules.trccon2 = trccon2 = tXXDController(settings.timing.tRC)
-        self.comb += trccon2.valid.eq(cmd.valid & cmd.ready & row_open)
-        
-        self.submodules.trccon3 = trccon3 = tXXDController(settings.timing.tRC)
-        self.comb += trccon3.valid.eq(cmd.valid & cmd.ready & row_open)
-        
-        trcSig = Cat(trccon.ready, trccon2.ready, trccon3.ready)
-        trcVote = TMRInput(trcSig)
-        self.submodules += trcVote
-
-        # tRAS (activate-precharge) controller -----------------------------------------------------
-        self.submodules.trascon = trascon = tXXDController(settings.timing.tRAS)
-        self.comb += trascon.valid.eq(cmd.valid & cmd.ready & row_open)
-        
-        self.submodules.trascon2 = trascon2 = tXXDController(settings.timing.tRAS)
-        self.comb += trascon2.valid.eq(cmd.valid & cmd.ready & row_open)
-        
-        self.submodules.trascon3 = trascon3 = tXXDController(settings.timing.tRAS)
-        self.comb += trascon3.valid.eq(cmd.valid & cmd.ready & row_open)
-        
-        trasSig = Cat(trascon.ready, trascon2.ready, trascon3.ready)
-        trasVote = TMRInput(trasSig)
-        self.submodules += trasVote
+        self.comb += trccon.valid.eq(cmd_fire & row_open)
 
         # Auto Precharge generation ----------------------------------------------------------------
         # generate auto precharge when current and next cmds are to different rows
+        # Registered: the lookahead/buffer row compare is stable for the whole
+        # life of the buffered command, so a one-cycle-late auto_precharge is
+        # safe and keeps the wide row comparator out of the cmd.a/FSM paths.
         if settings.with_auto_precharge:
-            self.comb += \
-                If(lookValidVote.control & bufValidVote.control,
-                    If(slicer.row(lookAddrVote.control) !=
-                       slicer.row(bufAddrVote.control),
-                        auto_precharge.eq(row_close == 0)
-                    )
-                )
+            self.sync += auto_precharge.eq(
+                lookValidVote.control & bufValidVote.control &
+                (look_row != buf_row) & ~row_close)
 
         # Control and command generation FSM -------------------------------------------------------
-        # Note: tRRD, tFAW, tCCD, tWTR timings are enforced by the multiplexer
-        self.submodules.fsm = fsm = FSM()
-        fsm.act("REGULAR",
-            fsm_state.eq(0),
-            If(refresh_req,
-                NextState("REFRESH")
-            ).Elif(bufValidVote.control,
-                If(row_opened,
-                    If(row_hit,
-                        cmd.valid.eq(1),
-                        If(bufWeVote.control,
-                            req.wdata_ready.eq(cmd.ready),
-                            cmd.is_write.eq(1),
-                            cmd.we.eq(1),
-                        ).Else(
-                            req.rdata_valid.eq(cmd.ready),
-                            cmd.is_read.eq(1)
-                        ),
-                        cmd.cas.eq(1),
-                        If(cmd.ready & auto_precharge,
-                           NextState("AUTOPRECHARGE")
-                        )
-                    ).Else(  # row_opened & ~row_hit
-                        NextState("PRECHARGE")
-                    )
-                ).Else(  # ~row_opened
-                    NextState("ACTIVATE")
-                )
-            )
-        )
-        fsm.act("PRECHARGE",
-            fsm_state.eq(1),
-            # Note: we are presenting the column address, A10 is always low
-            If(twtpVote.control & trasVote.control,
-                cmd.valid.eq(1),
-                If(cmd.ready,
-                    NextState("TRP")
-                ),
-                cmd.ras.eq(1),
-                cmd.we.eq(1),
-                cmd.is_cmd.eq(1)
-            ),
-            row_close.eq(1)
-        )
-        fsm.act("AUTOPRECHARGE",
-            fsm_state.eq(2),
-            If(twtpVote.control & trasVote.control,
-                NextState("TRP")
-            ),
-            row_close.eq(1)
-        )
-        fsm.act("ACTIVATE",
-            fsm_state.eq(3),
-            If(trcVote.control,
-                row_col_n_addr_sel.eq(1),
-                row_open.eq(1),
-                cmd.valid.eq(1),
-                cmd.is_cmd.eq(1),
-                If(cmd.ready,
-                    NextState("TRCD")
-                ),
-                cmd.ras.eq(1)
-            )
-        )
-        fsm.act("REFRESH",
-            fsm_state.eq(4),
-            If(twtpVote.control,
-                refresh_gnt.eq(1),
-            ),
-            row_close.eq(1),
-            cmd.is_cmd.eq(1),
-            If(~refresh_req,
-                NextState("REGULAR")
-            )
-        )
-        fsm.delayed_enter("TRP", "ACTIVATE", settings.timing.tRP - 1)
-        fsm.delayed_enter("TRCD", "REGULAR", settings.timing.tRCD - 1)
+        self.submodules.fsm = _BankMachineFSM(settings, cmd, req,
+            refresh_req        = refresh_req,
+            refresh_gnt        = refresh_gnt,
+            fsm_state          = fsm_state,
+            buf_valid          = bufValidVote.control,
+            buf_we             = bufWeVote.control,
+            row_opened         = row_opened,
+            row_hit            = row_hit,
+            auto_precharge     = auto_precharge,
+            row_open           = row_open,
+            row_close          = row_close,
+            row_col_n_addr_sel = row_col_n_addr_sel,
+            twtp_ready         = twtpcon.ready,
+            trc_ready          = trccon.ready)
@@ -27,11 +27,31 @@ class ControllerSettings(Settings):
         # Command buffers
         cmd_buffer_depth    = 8,
         cmd_buffer_buffered = False,
+        # Prefer block-RAM inference for the command buffers when they are
+        # deep enough for the tools to map them to a BRAM primitive.
+        cmd_buffer_bram     = True,
+
+        # In-flight requests per bank before the crossbar port is locked.
+        # Values > 1 unlock the port while a write's data is still in flight;
+        # without per-bank write-data staging two BankMachines can then
+        # assert wdata_ready out of order and corrupt write data. Keep at 1
+        # unless the data path stages write data per bank.
+        max_pending         = 1,
 
         # Read/Write times
         read_time           = 32,
         write_time          = 16,
 
+        # Write-queue watermarks: the multiplexer switches to writes when
+        # write_hi_watermark writes are pending, and back to reads once
+        # writes drain below write_lo_watermark, read_drain_hi reads are
+        # pending, or the write timeslice expires. The hi/read thresholds
+        # seed runtime-tunable CSRs; the lo threshold is an elaboration-time
+        # constant.
+        write_hi_watermark  = 4,
+        write_lo_watermark  = 1,
+        read_drain_hi       = 4,
+
         # Bandwidth
         with_bandwidth      = False,
 
@@ -55,7 +75,12 @@ class ControllerSettings(Settings):
         with_auto_precharge = True,
 
         # Address mapping
-        address_mapping     = "ROW_BANK_COL"):
+        address_mapping     = "ROW_BANK_COL",
+        # Optional bank alignment (in bytes); when non-zero the bank bits are
+        # taken above this alignment so consecutive accesses within an aligned
+        # region stay in the same bank.
+        bank_byte_alignment = 0):
+        assert address_mapping in ["ROW_BANK_COL", "BANK_ROW_COL"]
         self.set_attributes(locals())
 
 # Controller ---------------------------------------------------------------------------------------
@@ -110,20 +135,20 @@ class LiteDRAMController(Module, AutoCSR):
             postponing = self.settings.refresh_postponing)
 
         # Bank Machines ----------------------------------------------------------------------------
+        banks = [getattr(TMRinterface, "bank"+str(n)) for n in range(nranks*nbanks)]
         bank_machines = []
-        for n in range(nranks*nbanks):
+        for n, bank_if in enumerate(banks):
             bank_machine = BankMachine(n,
                 address_width = interface.address_width,
                 address_align = address_align,
                 nranks        = nranks,
                 settings      = self.settings,
-                TMRreq        = getattr(TMRinterface, "bank"+str(n)),
+                TMRreq        = bank_if,
                 logger        = logger)
             bank_machines.append(bank_machine)
             self.submodules += bank_machine
             setattr(self, 'bm_'+str(n), bank_machine)
-            #self.comb += getattr(interface, "bank"+str(n)).connect(bank_machine.req)
-            self.comb += getattr(TMRinterface, "bank"+str(n)).connect(bank_machine.TMRreq)
+            self.comb += bank_if.connect(bank_machine.TMRreq)
 
         # Multiplexer ------------------------------------------------------------------------------
         self.submodules.multiplexer = Multiplexer(
@@ -130,8 +130,16 @@ class LiteDRAMCrossbar(Module):
         nmasters   = len(self.masters)
 
         # Address mapping --------------------------------------------------------------------------
-        cba_shifts = {"ROW_BANK_COL": controller.settings.geom.colbits - controller.address_align}
+        cba_shifts = {
+            "ROW_BANK_COL": controller.settings.geom.colbits - controller.address_align,
+            "BANK_ROW_COL": self.rca_bits,
+        }
         cba_shift = cba_shifts[controller.settings.address_mapping]
+        if controller.settings.bank_byte_alignment:
+            # Pick the bank bits above the requested byte alignment so accesses within an aligned
+            # region (e.g. an L2 way) do not rotate through the banks.
+            burst_bytes = controller.data_width//8
+            cba_shift = max(cba_shift, log2_int(controller.settings.bank_byte_alignment//burst_bytes))
         m_ba      = [m.get_bank_address(self.bank_bits, cba_shift)for m in self.masters]
         m_rca     = [m.get_row_column_address(self.bank_bits, self.rca_bits, cba_shift) for m in self.masters]
 
@@ -48,12 +48,14 @@ class LoggingSystem(Module, AutoCSR):
         self.messages = []
         self.readys = []
         self.requests = []
-    
+        self.source_ids = []
+
         self._log_csr = log_csr = CSRStatus(48, name='log_buffer')
-        
-        self.log_fifo = log_fifo = SyncFIFO(48, 50)
+
+        # Buffered FIFO so the storage infers as a single block RAM shared by
+        # all log sources instead of distributed LUTRAM.
+        self.log_fifo = log_fifo = SyncFIFOBuffered(48, 50)
         self.submodules += log_fifo
-        self.comb += [log_fifo.replace.eq(0)]
         
         # On log read, try to read from FIFO
         #self.sync += If(log_csr.we, 
@@ -69,28 +71,37 @@ class LoggingSystem(Module, AutoCSR):
         # Read into empty CSR
         #self.sync += [If((log_csr.status == -1) & log_fifo.readable, log_csr.status.eq(log_fifo.dout), log_fifo.re.eq(1))]
         
-    def get_log_port(self):
+    def get_log_port(self, source_id=None):
         message = Signal(48)
         ready = Signal()
         request = Signal()
-        
+
         self.messages.append(message)
         self.readys.append(ready)
         self.requests.append(request)
-        
+        self.source_ids.append(source_id)
+
         return message, ready, request
         
     def do_finalize(self):
         #Create Arbiter
         arbiter = roundrobin.RoundRobin(len(self.messages), roundrobin.SP_CE)
         self.submodules += arbiter
-        
-        self.comb += [self.log_fifo.din.eq(Array(self.messages)[arbiter.grant]),                            #Map arbiter grant to data in
-                        arbiter.ce.eq(self.log_fifo.writable),                                              #Arbitrate if fifo is writable
-                        self.log_fifo.we.eq(self.log_fifo.writable & Array(self.requests)[arbiter.grant]),  #Write if writable and request available
-                        arbiter.request.eq(Cat(self.requests))]                                             #Map requests to arbiter requests
-                        
-        #self.sync += If((self._log_csr.status == -1) & Array(self.requests)[arbiter.grant], self._log_csr.status.eq(Array(self.messages)[arbiter.grant]))
-                        
+
+        # Messages are registered at the source on grant, so the FIFO write
+        # happens one cycle later from a registered grant; only the winning
+        # source drives the message mux in any given cycle.
+        grant_r = Signal.like(arbiter.grant)
+        we_r    = Signal()
+        self.sync += [
+            grant_r.eq(arbiter.grant),
+            we_r.eq(self.log_fifo.writable & Array(self.requests)[arbiter.grant] & ~we_r)
+        ]
+
+        self.comb += [self.log_fifo.din.eq(Array(self.messages)[grant_r]),  #Sample the granted source's registered message
+                        arbiter.ce.eq(self.log_fifo.writable),              #Arbitrate if fifo is writable
+                        self.log_fifo.we.eq(we_r & self.log_fifo.writable), #Write one cycle after grant
+                        arbiter.request.eq(Cat(self.requests))]             #Map requests to arbiter requests
+
         for i, ready in enumerate(self.readys):
-            self.comb += ready.eq((arbiter.grant == i) & self.log_fifo.writable)
\ No newline at end of file
+            self.comb += ready.eq((arbiter.grant == i) & self.log_fifo.writable & ~we_r)
\ No newline at end of file
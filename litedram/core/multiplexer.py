@@ -10,14 +10,14 @@
 
 import math
 from functools import reduce
-from operator import or_, and_
+from operator import or_, and_, add
 
 from migen import *
 from migen.genlib.roundrobin import *
-from migen.genlib.coding import Decoder
+from migen.genlib.coding import Decoder, PriorityEncoder
 
 from litex.soc.interconnect import stream
-from litex.soc.interconnect.csr import AutoCSR
+from litex.soc.interconnect.csr import AutoCSR, CSRStorage
 
 from litedram.common import *
 from litedram.core.bandwidth import Bandwidth
@@ -26,6 +26,70 @@ from litedram.phy import dfi
 
 # _CommandChooser ----------------------------------------------------------------------------------
 
+def _compute_valids(module, requests, want_reads, want_writes, want_cmds, want_activates):
+    """Per-request arbitration filter shared by the command choosers
+
+    Returns a Signal(len(requests)) with one bit per request, set when the
+    request passes the want_* filters. The computation is pure combinational,
+    so TMR replicas can share a single instance and only triplicate their
+    arbiter state.
+    """
+    valids = Signal(len(requests))
+    # The want_* filters are shared across all requests; precompute the two
+    # possible command permissions once instead of re-ANDing the scalars in
+    # every per-request cone.
+    allow_cmd_act    = Signal()
+    allow_cmd_nonact = Signal()
+    module.comb += [
+        allow_cmd_act.eq(want_cmds & want_activates),
+        allow_cmd_nonact.eq(want_cmds)
+    ]
+    for i, request in enumerate(requests):
+        is_act_cmd = request.ras & ~request.cas & ~request.we
+        command = request.is_cmd & Mux(is_act_cmd, allow_cmd_act, allow_cmd_nonact)
+        read = request.is_read == want_reads
+        write = request.is_write == want_writes
+        module.comb += valids[i].eq(request.valid & (command | (read & write)))
+    return valids
+
+def _connect_TMR_cmd(module, src, dst):
+    """Vote a whole TMR command endpoint with a single TMRInput
+
+    Packs all input fields of src (a TMR command endpoint, 3x field widths)
+    into one flattened bus and runs one voter across it, instead of one
+    TMRInput submodule per field. TMR buses are copy-major, so the packing
+    regroups the per-field copy slices copy by copy to keep the voter's
+    three thirds aligned. The ready backpressure is replicated back with a
+    single TMROutput.
+    """
+    fields = ["valid", "last", "first", "a", "ba", "cas", "ras", "we",
+              "is_cmd", "is_read", "is_write"]
+    srcs = [getattr(src, f) for f in fields]
+    dsts = [getattr(dst, f) for f in fields]
+    copies = []
+    for i in range(3):
+        copies += [sig[i*(len(sig)//3):(i+1)*(len(sig)//3)] for sig in srcs]
+    module.submodules += TMRInput(Cat(*copies), Cat(*dsts))
+    module.submodules += TMROutput(dst.ready, src.ready)
+
+def _replicate_TMR(owner, name, cls, *args, share=None, **kwargs):
+    """Instantiate three TMR replicas of cls as owner submodules
+
+    The replicas are registered under the usual replica naming scheme
+    (name, name2, name3) and returned as a list. share maps a keyword
+    argument to an attribute of the first replica, letting later replicas
+    reuse logic the first one builds (e.g. the steerer rank decoders).
+    """
+    insts = []
+    for i in range(3):
+        if insts and share:
+            kwargs = dict(kwargs, **{kw: getattr(insts[0], attr)
+                                     for kw, attr in share.items()})
+        inst = cls(*args, **kwargs)
+        setattr(owner.submodules, name if i == 0 else name + str(i + 1), inst)
+        insts.append(inst)
+    return insts
+
 class _CommandChooser(Module):
     """Arbitrates between requests, filtering them based on their type
 
@@ -66,38 +130,39 @@ class _CommandChooser(Module):
 
         n = len(requests)
 
-        valids = Signal(n)
-        for i, request in enumerate(requests):
-            is_act_cmd = request.ras & ~request.cas & ~request.we
-            command = request.is_cmd & self.want_cmds & (~is_act_cmd | self.want_activates)
-            read = request.is_read == self.want_reads
-            write = request.is_write == self.want_writes
-            self.comb += valids[i].eq(request.valid & (command | (read & write)))
-
+        valids = _compute_valids(self, requests,
+            self.want_reads, self.want_writes, self.want_cmds, self.want_activates)
 
         arbiter = RoundRobin(n, SP_CE)
         self.submodules += arbiter
-        choices = Array(valids[i] for i in range(n))
+        # Decode the grant to one-hot once; AND/OR reductions then replace
+        # the binary-indexed Array muxes on every output, saving the
+        # bin->onehot decode level per muxed field.
+        grant_oh = Signal(n)
         self.comb += [
+            grant_oh.eq(1 << arbiter.grant),
             arbiter.request.eq(valids),
-            cmd.valid.eq(choices[arbiter.grant])
+            cmd.valid.eq((valids & grant_oh) != 0)
         ]
 
+        def grant_mux(name):
+            width = len(getattr(cmd, name))
+            return tree_reduce(or_, [Replicate(grant_oh[i], width) & getattr(req, name)
+                                     for i, req in enumerate(requests)])
+
         for name in ["a", "ba", "is_read", "is_write", "is_cmd"]:
-            choices = Array(getattr(req, name) for req in requests)
-            self.comb += getattr(cmd, name).eq(choices[arbiter.grant])
+            self.comb += getattr(cmd, name).eq(grant_mux(name))
 
         for name in ["cas", "ras", "we"]:
             # we should only assert those signals when valid is 1
-            choices = Array(getattr(req, name) for req in requests)
             self.comb += \
                 If(cmd.valid,
-                    getattr(cmd, name).eq(choices[arbiter.grant])
+                    getattr(cmd, name).eq(grant_mux(name))
                 )
 
         for i, request in enumerate(requests):
             self.comb += \
-                If(cmd.valid & cmd.ready & (arbiter.grant == i),
+                If(cmd.valid & cmd.ready & grant_oh[i],
                     request.ready.eq(1)
                 )
         # Arbitrate if a command is being accepted or if the command is not valid to ensure a valid
@@ -139,10 +204,14 @@ class _CommandChooserInt(Module):
     want_activates : Signal, in
         Also consider ACT commands
     """
-    def __init__(self, nreqs, a, ba):
-        self.requests = requests = [stream.Endpoint(cmd_request_rw_layout(a, ba)) for n in range(nreqs)]
-        self.cmd = cmd = stream.Endpoint(cmd_request_rw_layout(a, ba))
-        
+    def __init__(self, nreqs, a, ba, valids=None, max_cycles=None, layout=None):
+        # The layout only depends on a/ba; the caller can pass a prebuilt one
+        # so the TMR replicas and their request slots share a single object.
+        if layout is None:
+            layout = cmd_request_rw_layout(a, ba)
+        self.requests = requests = [stream.Endpoint(layout) for n in range(nreqs)]
+        self.cmd = cmd = stream.Endpoint(layout)
+
         self.want_reads     = Signal()
         self.want_writes    = Signal()
         self.want_cmds      = Signal()
@@ -150,47 +219,90 @@ class _CommandChooserInt(Module):
 
         # # #
 
-        # Find valid requests
-        valids = Signal(nreqs)
+        # Find valid requests; a shared (already filtered) valids bundle can
+        # be passed in so TMR replicas only triplicate their arbiter state
+        if valids is None:
+            valids = _compute_valids(self, requests,
+                self.want_reads, self.want_writes, self.want_cmds, self.want_activates)
+
+        # FR-FCFS: prefer column (CAS) commands over row (ACT) commands to
+        # exploit already-open pages; lower-priority requests are hidden from
+        # the arbiter while any higher-priority request is pending.
+        priority   = Signal(nreqs)
+        any_hi     = Signal()
+        arb_valids = Signal(nreqs)
         for i, request in enumerate(requests):
-            is_act_cmd = request.ras & ~request.cas & ~request.we
-            command = request.is_cmd & self.want_cmds & (~is_act_cmd | self.want_activates)
-            read = request.is_read == self.want_reads
-            write = request.is_write == self.want_writes
-            self.comb += valids[i].eq(request.valid & (command | (read & write)))
-
-        # Create arbiters
-        arbiter = RoundRobin(nreqs, SP_CE)
-        self.submodules += arbiter
-        choices = Array(valids[i] for i in range(nreqs))
+            self.comb += priority[i].eq(~(request.ras & ~request.cas & ~request.we))
         self.comb += [
-            arbiter.request.eq(valids),
-            cmd.valid.eq(choices[arbiter.grant])
+            any_hi.eq((valids & priority) != 0),
+            arb_valids.eq(Mux(any_hi, valids & priority, valids))
         ]
 
+        # Create arbiters. The round-robin grant is persistent sequential
+        # state, so it lives in three replica arbiters fed with identical
+        # requests and the one-hot grants are majority-voted before use;
+        # only the few grant flops are triplicated, the wide valids/priority
+        # filters and the output muxes below are built once.
+        arbiters = [RoundRobin(nreqs, SP_CE) for i in range(3)]
+        self.submodules += arbiters
+        grant_ohs = [Signal(nreqs) for i in range(3)]
+        self.comb += [oh.eq(1 << arbiter.grant)
+                      for oh, arbiter in zip(grant_ohs, arbiters)]
+        # Voted one-hot grant; shared by the output muxes and the timeslice mask
+        grant_oh = Signal(nreqs)
+        self.comb += grant_oh.eq(maj3(*grant_ohs))
+        if max_cycles is None:
+            self.comb += [arbiter.request.eq(arb_valids) for arbiter in arbiters]
+        else:
+            # Bound how long a single requester can hold the grant: after
+            # max_cycles accepted beats its request line is masked so any
+            # other pending requester wins the next arbitration. The granted
+            # stream itself keeps flowing while masked, so an otherwise idle
+            # system still streams page hits from a single bank.
+            grant_oh_r = Signal(nreqs)
+            timeslice  = Signal(max=max_cycles+1)
+            expired    = Signal()
+            self.comb += expired.eq(timeslice == max_cycles)
+            self.comb += [
+                arbiter.request.eq(arb_valids & ~(grant_oh & Replicate(expired, nreqs)))
+                for arbiter in arbiters
+            ]
+            self.sync += [
+                grant_oh_r.eq(grant_oh),
+                If(grant_oh != grant_oh_r,
+                    timeslice.eq(0)
+                ).Elif(cmd.valid & cmd.ready & ~expired,
+                    timeslice.eq(timeslice + 1)
+                )
+            ]
+        self.comb += cmd.valid.eq((valids & grant_oh) != 0)
+
+        def grant_mux(name):
+            width = len(getattr(cmd, name))
+            return tree_reduce(or_, [Replicate(grant_oh[i], width) & getattr(req, name)
+                                     for i, req in enumerate(requests)])
+
         # Connect arbiter selection to cmd
         for name in ["a", "ba", "is_read", "is_write", "is_cmd"]:
-            choices = Array(getattr(req, name) for req in requests)
-            self.comb += getattr(cmd, name).eq(choices[arbiter.grant])
+            self.comb += getattr(cmd, name).eq(grant_mux(name))
 
         for name in ["cas", "ras", "we"]:
             # we should only assert those signals when valid is 1
-            choices = Array(getattr(req, name) for req in requests)
             self.comb += \
                 If(cmd.valid,
-                    getattr(cmd, name).eq(choices[arbiter.grant])
+                    getattr(cmd, name).eq(grant_mux(name))
                 )
 
         # Connect arbiter selection to req.ready
         for i, request in enumerate(requests):
             self.comb += \
-                If(cmd.valid & cmd.ready & (arbiter.grant == i),
+                If(cmd.valid & cmd.ready & grant_oh[i],
                     request.ready.eq(1)
                 )
                 
         # Arbitrate if a command is being accepted or if the command is not valid to ensure a valid
         # command is selected when cmd.ready goes high.
-        self.comb += arbiter.ce.eq(cmd.ready | ~cmd.valid)
+        self.comb += [arbiter.ce.eq(cmd.ready | ~cmd.valid) for arbiter in arbiters]
 
     # helpers
     def accept(self):
@@ -246,38 +358,47 @@ class _Steerer(Module):
             else:
                 return cmd.valid & cmd.ready & getattr(cmd, attr)
 
+        # Build the per-attribute Arrays once outside the phase loop; every
+        # [sel] below still emits its own mux, the slices and gates are just
+        # not reconstructed per phase.
+        nranks   = len(dfi.phases[0].cs_n)
+        rankbits = log2_int(nranks)
+        a_arr      = Array(cmd.a for cmd in commands)
+        if rankbits:
+            ba_rank_arr = Array(cmd.ba[-rankbits:] for cmd in commands)
+            ba_bank_arr = Array(cmd.ba[:-rankbits] for cmd in commands)
+        else:
+            ba_bank_arr = Array(cmd.ba[:] for cmd in commands)
+        cas_arr    = Array(valid_and(cmd, "cas") for cmd in commands)
+        ras_arr    = Array(valid_and(cmd, "ras") for cmd in commands)
+        we_arr     = Array(valid_and(cmd, "we") for cmd in commands)
+        rddata_ens = Array(valid_and(cmd, "is_read") for cmd in commands)
+        wrdata_ens = Array(valid_and(cmd, "is_write") for cmd in commands)
+
         for i, (phase, sel) in enumerate(zip(dfi.phases, self.sel)):
-            nranks   = len(phase.cs_n)
-            rankbits = log2_int(nranks)
             if hasattr(phase, "reset_n"):
                 self.comb += phase.reset_n.eq(1)
-            self.comb += phase.cke.eq(Replicate(Signal(reset=1), nranks))
+            self.comb += phase.cke.eq(Replicate(C(1, 1), nranks))
             if hasattr(phase, "odt"):
                 # FIXME: add dynamic drive for multi-rank (will be needed for high frequencies)
-                self.comb += phase.odt.eq(Replicate(Signal(reset=1), nranks))
+                self.comb += phase.odt.eq(Replicate(C(1, 1), nranks))
             if rankbits:
                 rank_decoder = Decoder(nranks)
                 self.submodules += rank_decoder
-                self.comb += rank_decoder.i.eq((Array(cmd.ba[-rankbits:] for cmd in commands)[sel]))
+                self.comb += rank_decoder.i.eq(ba_rank_arr[sel])
                 if i == 0: # Select all ranks on refresh.
                     self.sync += If(sel == STEER_REFRESH, phase.cs_n.eq(0)).Else(phase.cs_n.eq(~rank_decoder.o))
                 else:
                     self.sync += phase.cs_n.eq(~rank_decoder.o)
-                self.sync += phase.bank.eq(Array(cmd.ba[:-rankbits] for cmd in commands)[sel])
             else:
                 self.sync += phase.cs_n.eq(0)
-                self.sync += phase.bank.eq(Array(cmd.ba[:] for cmd in commands)[sel])
-
-            self.sync += [
-                phase.address.eq(Array(cmd.a for cmd in commands)[sel]),
-                phase.cas_n.eq(~Array(valid_and(cmd, "cas") for cmd in commands)[sel]),
-                phase.ras_n.eq(~Array(valid_and(cmd, "ras") for cmd in commands)[sel]),
-                phase.we_n.eq(~Array(valid_and(cmd, "we") for cmd in commands)[sel])
-            ]
+            self.sync += phase.bank.eq(ba_bank_arr[sel])
 
-            rddata_ens = Array(valid_and(cmd, "is_read") for cmd in commands)
-            wrdata_ens = Array(valid_and(cmd, "is_write") for cmd in commands)
             self.sync += [
+                phase.address.eq(a_arr[sel]),
+                phase.cas_n.eq(~cas_arr[sel]),
+                phase.ras_n.eq(~ras_arr[sel]),
+                phase.we_n.eq(~we_arr[sel]),
                 phase.rddata_en.eq(rddata_ens[sel]),
                 phase.wrdata_en.eq(wrdata_ens[sel])
             ]
@@ -304,14 +425,24 @@ class _SteererInt(Module):
         DFI phase. The signals should take one of the values from STEER_* to
         select given source.
     """
-    def __init__(self, a, ba, nranks, databits, nphases):        
+    def __init__(self, a, ba, nranks, databits, nphases, valid_ands=None, rank_outputs=None, layout=None):
         ncmd = 4
         nph = nphases
-        
+
+        if layout is None:
+            layout = cmd_request_rw_layout(a, ba)
         self.sel = [Signal(max=ncmd) for i in range(nph)]
-        self.commands = commands = [stream.Endpoint(cmd_request_rw_layout(a, ba)) for n in range(4)]
+        self.commands = commands = [stream.Endpoint(layout) for n in range(4)]
         self.dfi = dfi.Interface(a, ba, nranks, databits, nphases)
 
+        # Per-phase decoded rank selects; the decode input comes from the
+        # shared command sources, so TMR replicas compute identical values
+        # and later replicas can reuse the first one's decoders by passing
+        # its rank_outputs in.
+        share_rank_outputs = rank_outputs is not None
+        if not share_rank_outputs:
+            self.rank_outputs = rank_outputs = []
+
         # # #
 
         def valid_and(cmd, attr):
@@ -320,43 +451,80 @@ class _SteererInt(Module):
             else:
                 return cmd.valid & cmd.ready & getattr(cmd, attr)
 
+        # The valid & ready & attr gates are identical across TMR replicas
+        # (the command sources are shared), so the caller can pass the gated
+        # per-command signals in to avoid synthesising them per replica.
+        if valid_ands is None:
+            valid_ands = {attr: [valid_and(cmd, attr) for cmd in commands]
+                          for attr in ("cas", "ras", "we", "is_read", "is_write")}
+
+        # The per-attribute source lists are fixed per steerer; build them
+        # once here instead of re-slicing the command records in every phase.
+        rankbits = log2_int(nranks)
+        a_values = [cmd.a for cmd in commands]
+        if rankbits:
+            ba_hi_values = [cmd.ba[-rankbits:] for cmd in commands]
+            ba_lo_values = [cmd.ba[:-rankbits] for cmd in commands]
+        else:
+            ba_lo_values = [cmd.ba[:] for cmd in commands]
+
         for i, (phase, sel) in enumerate(zip(self.dfi.phases, self.sel)):
-            rankbits = log2_int(nranks)
-            
             if hasattr(phase, "reset_n"):
                 self.comb += phase.reset_n.eq(1)
-            self.comb += phase.cke.eq(Replicate(Signal(reset=1), nranks))
-            
+            self.comb += phase.cke.eq(Replicate(C(1, 1), nranks))
+
             if hasattr(phase, "odt"):
                 # FIXME: add dynamic drive for multi-rank (will be needed for high frequencies)
-                self.comb += phase.odt.eq(Replicate(Signal(reset=1), nranks))
-            
+                self.comb += phase.odt.eq(Replicate(C(1, 1), nranks))
+
+            # Decode sel once to one-hot; every phase output then shares the
+            # decode through AND/OR reductions instead of eleven Array muxes.
+            sel_oh = Signal(ncmd)
+            self.comb += sel_oh.eq(1 << sel)
+
+            def onehot_mux(width, values):
+                parts = [Replicate(sel_oh[j], width) & value
+                         for j, value in enumerate(values)
+                         if not isinstance(value, int)]
+                if not parts:
+                    return 0
+                return tree_reduce(or_, parts)
+
             if rankbits:
-                rank_decoder = Decoder(nranks)
-                self.submodules += rank_decoder
-                self.comb += rank_decoder.i.eq((Array(cmd.ba[-rankbits:] for cmd in commands)[sel]))
+                if share_rank_outputs:
+                    rank_output = rank_outputs[i]
+                else:
+                    rank_decoder = Decoder(nranks)
+                    self.submodules += rank_decoder
+                    # Register the selected rank bits first and decode from
+                    # the registered value, so the mux + decoder + invert
+                    # cone is split across the register instead of feeding
+                    # cs_n whole; cs_n keeps the same one-cycle alignment as
+                    # the other phase outputs.
+                    sel_ba_hi = Signal(rankbits)
+                    self.sync += sel_ba_hi.eq(onehot_mux(rankbits, ba_hi_values))
+                    self.comb += rank_decoder.i.eq(sel_ba_hi)
+                    rank_output = rank_decoder.o
+                    rank_outputs.append(rank_output)
                 if i == 0: # Select all ranks on refresh.
-                    self.sync += If(sel == STEER_REFRESH, phase.cs_n.eq(0)).Else(phase.cs_n.eq(~rank_decoder.o))
+                    sel_refresh_r = Signal()
+                    self.sync += sel_refresh_r.eq(sel_oh[STEER_REFRESH])
+                    self.comb += If(sel_refresh_r, phase.cs_n.eq(0)).Else(phase.cs_n.eq(~rank_output))
                 else:
-                    self.sync += phase.cs_n.eq(~rank_decoder.o)
-                self.sync += phase.bank.eq(Array(cmd.ba[:-rankbits] for cmd in commands)[sel])
+                    self.comb += phase.cs_n.eq(~rank_output)
+                self.sync += phase.bank.eq(onehot_mux(len(phase.bank), ba_lo_values))
             else:
                 self.sync += phase.cs_n.eq(0)
-                self.sync += phase.bank.eq(Array(cmd.ba[:] for cmd in commands)[sel])
+                self.sync += phase.bank.eq(onehot_mux(len(phase.bank), ba_lo_values))
 
             # Connect selection to dfi
             self.sync += [
-                phase.address.eq(Array(cmd.a for cmd in commands)[sel]),
-                phase.cas_n.eq(~Array(valid_and(cmd, "cas") for cmd in commands)[sel]),
-                phase.ras_n.eq(~Array(valid_and(cmd, "ras") for cmd in commands)[sel]),
-                phase.we_n.eq(~Array(valid_and(cmd, "we") for cmd in commands)[sel])
-            ]
-
-            rddata_ens = Array(valid_and(cmd, "is_read") for cmd in commands)
-            wrdata_ens = Array(valid_and(cmd, "is_write") for cmd in commands)
-            self.sync += [
-                phase.rddata_en.eq(rddata_ens[sel]),
-                phase.wrdata_en.eq(wrdata_ens[sel])
+                phase.address.eq(onehot_mux(len(phase.address), a_values)),
+                phase.cas_n.eq(~onehot_mux(1, valid_ands["cas"])),
+                phase.ras_n.eq(~onehot_mux(1, valid_ands["ras"])),
+                phase.we_n.eq(~onehot_mux(1, valid_ands["we"])),
+                phase.rddata_en.eq(onehot_mux(1, valid_ands["is_read"])),
+                phase.wrdata_en.eq(onehot_mux(1, valid_ands["is_write"]))
             ]
 
 # Multiplexer --------------------------------------------------------------------------------------
@@ -406,8 +574,8 @@ class Multiplexer(Module, AutoCSR):
         
         self.comb += [log_n.eq(8), log_info.eq(0)]
         
-        message, ready, request = logger.get_log_port()
-        self.comb += message.eq(Cat(log_info, log_val, log_n))
+        message, ready, request = logger.get_log_port(source_id="multiplexer")
+        self.sync += If(request & ready, message.eq(Cat(log_info, log_val, log_n)))
         
         log_sigs = []
         log_codes = []
@@ -428,36 +596,26 @@ class Multiplexer(Module, AutoCSR):
             log_rising_edge(log_sig, track_sig)
             
         # FSM State Logs
-        fsm_state = Signal(max=2)
-           
+        fsm_state = Signal(max=3)
+
         if settings.verbose_logging:
             create_rising_edge_log_sig(0, fsm_state == 0)
             create_rising_edge_log_sig(1, fsm_state == 1)
             create_rising_edge_log_sig(2, fsm_state == 2)
-                     
-        # Send message based on priority
-        statement = None
-        for log_sig, log_code in zip(log_sigs, log_codes):
-            if statement is not None:
-                statement = statement.Elif(log_sig, log_num.eq(log_code))
-            else:
-                statement = If(log_sig, log_num.eq(log_code))
-        if statement is not None:
-            self.comb += statement
-            
-        # Confirm message based on priority
-        statement = None
-        for log_sig, log_code in zip(log_sigs, log_codes):
-            if statement is not None:
-                statement = statement.Elif(log_sig, log_sig.eq(0))
-            else:
-                statement = If(log_sig, log_sig.eq(0))
-        if statement is not None:
-            self.sync += If(ready, statement)
-                
-        # Request when waiting for any log message
+
         if len(log_sigs) > 0:
-            self.comb += request.eq(reduce(or_, log_sigs))
+            log_pe = PriorityEncoder(len(log_sigs))
+            self.submodules += log_pe
+            self.comb += log_pe.i.eq(Cat(*log_sigs))
+
+            # Send message based on priority
+            self.comb += If(~log_pe.n, log_val.eq(Array(log_codes)[log_pe.o]))
+
+            # Confirm message based on priority
+            self.sync += If(ready & ~log_pe.n, Array(log_sigs)[log_pe.o].eq(0))
+
+            # Request when waiting for any log message
+            self.comb += request.eq(~log_pe.n)
 
         # Read/Write Cmd/Dat phases ----------------------------------------------------------------
         ras_allowed = Signal(reset=1)
@@ -466,63 +624,81 @@ class Multiplexer(Module, AutoCSR):
         nphases = settings.phy.nphases
         rdphase = settings.phy.rdphase
         wrphase = settings.phy.wrphase
-        if isinstance(rdphase, Signal):
-            rdcmdphase = Signal.like(rdphase)
-            self.comb += rdcmdphase.eq(rdphase - 1) # Implicit %nphases.
-        else:
-            rdcmdphase = (rdphase - 1)%nphases
-            
-        if isinstance(rdphase, Signal):
-            wrcmdphase = Signal.like(wrphase)
-            self.comb += wrcmdphase.eq(wrphase - 1) # Implicit %nphases.
-        else:
-            wrcmdphase = (wrphase - 1)%nphases
+
+        def cmdphase(phase):
+            # Commands are sent one phase before their data phase
+            if isinstance(phase, Signal):
+                cp = Signal.like(phase)
+                self.comb += cp.eq(phase - 1) # Implicit %nphases.
+                return cp
+            return (phase - 1)%nphases
+
+        rdcmdphase = cmdphase(rdphase)
+        wrcmdphase = cmdphase(wrphase)
 
         # Command choosing -------------------------------------------------------------------------
         
         #Create cmd's from TMRcmd's
         requests = [bm.cmd for bm in bank_machines]
         
-        TMRrequests = [stream.Endpoint(cmd_request_rw_layout(settings.geom.addressbits, settings.geom.bankbits + log2_int(settings.phy.nranks))) for bm in bank_machines]
+        # Build the request layout once; every endpoint below shares it.
+        req_layout = cmd_request_rw_layout(settings.geom.addressbits,
+                                           settings.geom.bankbits + log2_int(settings.phy.nranks))
+
+        TMRrequests = [stream.Endpoint(req_layout) for bm in bank_machines]
         
         for TMRrequest, bm in zip(TMRrequests, bank_machines):
-            self.submodules += TMRInput(bm.TMRcmd.valid, TMRrequest.valid)
-            self.submodules += TMRInput(bm.TMRcmd.last, TMRrequest.last)
-            self.submodules += TMROutput(TMRrequest.ready, bm.TMRcmd.ready)
-            self.submodules += TMRInput(bm.TMRcmd.first, TMRrequest.first)
-            self.submodules += TMRInput(bm.TMRcmd.a, TMRrequest.a)
-            self.submodules += TMRInput(bm.TMRcmd.ba, TMRrequest.ba)
-            self.submodules += TMRInput(bm.TMRcmd.cas, TMRrequest.cas)
-            self.submodules += TMRInput(bm.TMRcmd.ras, TMRrequest.ras)
-            self.submodules += TMRInput(bm.TMRcmd.we, TMRrequest.we)
-            self.submodules += TMRInput(bm.TMRcmd.is_cmd, TMRrequest.is_cmd)
-            self.submodules += TMRInput(bm.TMRcmd.is_read, TMRrequest.is_read)
-            self.submodules += TMRInput(bm.TMRcmd.is_write, TMRrequest.is_write)
+            _connect_TMR_cmd(self, bm.TMRcmd, TMRrequest)
         
         
         #CommandChoosers
         a = len(TMRrequests[0].a)
         ba = len(TMRrequests[0].ba)
-        
-        self.submodules.choose_cmd_int = choose_cmd_int = _CommandChooserInt(len(TMRrequests), a, ba)
-        self.submodules.choose_cmd_int2 = choose_cmd_int2 = _CommandChooserInt(len(TMRrequests), a, ba)
-        self.submodules.choose_cmd_int3 = choose_cmd_int3 = _CommandChooserInt(len(TMRrequests), a, ba)
-        
-        self.submodules.choose_req_int = choose_req_int = _CommandChooserInt(len(TMRrequests), a, ba)
-        self.submodules.choose_req_int2 = choose_req_int2 = _CommandChooserInt(len(TMRrequests), a, ba)
-        self.submodules.choose_req_int3 = choose_req_int3 = _CommandChooserInt(len(TMRrequests), a, ba)
-        
-        for i, TMRrequest in enumerate(TMRrequests):
-            #self.comb += TMRrequest.connect(choose_cmd_int.requests[i], choose_cmd_int2.requests[i], choose_cmd_int3.requests[i], 
-            #                                choose_req_int.requests[i])
-            self.comb += TMRrequest.connect(choose_cmd_int.requests[i], choose_cmd_int2.requests[i], choose_cmd_int3.requests[i], 
-                                            choose_req_int.requests[i], choose_req_int2.requests[i], choose_req_int3.requests[i])
-         
-        choose_cmd_source = stream.Endpoint(cmd_request_rw_layout(a, ba))
-        vote_TMR(self, choose_cmd_source, choose_cmd_int.cmd, choose_cmd_int2.cmd, choose_cmd_int3.cmd)
-        
-        choose_req_source = stream.Endpoint(cmd_request_rw_layout(a, ba))
-        vote_TMR(self, choose_req_source, choose_req_int.cmd, choose_req_int2.cmd, choose_req_int3.cmd)
+
+        # The valids filters are pure combinational and identical across TMR
+        # replicas, so compute them once from the voted requests and share the
+        # bundle; only the RoundRobin state inside each chooser is triplicated.
+        cmd_want_cmds      = Signal()
+        cmd_want_activates = Signal()
+        cmd_want_reads     = Signal()
+        cmd_want_writes    = Signal()
+        req_want_cmds      = Signal()
+        req_want_activates = Signal()
+        req_want_reads     = Signal()
+        req_want_writes    = Signal()
+
+        req_valids = _compute_valids(self, TMRrequests,
+            req_want_reads, req_want_writes, req_want_cmds, req_want_activates)
+
+        # Single chooser per path: the replicas consumed identical (already
+        # voted) requests and identical shared valids, so triplicating whole
+        # choosers only re-duplicated wide comparator clouds. The persistent
+        # grant state stays protected: each chooser holds it in three replica
+        # arbiters internally and majority-votes the one-hot grant.
+        self.submodules.choose_req_int = choose_req_int = _CommandChooserInt(
+            len(TMRrequests), a, ba, valids=req_valids, max_cycles=settings.timing.tRAS, layout=req_layout)
+
+        # A separate cmd (ACT/PRE) chooser path only makes sense with several
+        # phases; on single-phase PHYs the req chooser serves both roles.
+        if settings.phy.nphases > 1:
+            cmd_valids = _compute_valids(self, TMRrequests,
+                cmd_want_reads, cmd_want_writes, cmd_want_cmds, cmd_want_activates)
+
+            self.submodules.choose_cmd_int = choose_cmd_int = _CommandChooserInt(
+                len(TMRrequests), a, ba, valids=cmd_valids, max_cycles=settings.timing.tRAS, layout=req_layout)
+
+            for i, TMRrequest in enumerate(TMRrequests):
+                self.comb += TMRrequest.connect(choose_cmd_int.requests[i], choose_req_int.requests[i])
+
+            choose_cmd_source = choose_cmd_int.cmd
+        else:
+            for i, TMRrequest in enumerate(TMRrequests):
+                self.comb += TMRrequest.connect(choose_req_int.requests[i])
+
+        choose_req_source = choose_req_int.cmd
+
+        if settings.phy.nphases == 1:
+            choose_cmd_source = choose_req_source
         
         def choose_cmd_accept():
             return choose_cmd_source.valid & choose_cmd_source.ready
@@ -548,28 +724,26 @@ class Multiplexer(Module, AutoCSR):
         def choose_req_read():
             return choose_req_source.is_read
         
+        # Shared ACT detectors: the FSM guards below test these in both the
+        # READ and WRITE states, so compute them once instead of expanding
+        # the cas/ras/we comparator per use.
+        req_is_act = Signal()
+        cmd_is_act = Signal()
+        self.comb += [
+            req_is_act.eq(choose_req_activate()),
+            cmd_is_act.eq(choose_cmd_activate())
+        ]
+
         if settings.phy.nphases == 1:
             # When only 1 phase, use choose_req for all requests
-            choose_cmd_int = choose_req_int
-            self.comb += choose_req_int.want_cmds.eq(1)
-            self.comb += choose_req_int.want_activates.eq(ras_allowed)
+            self.comb += req_want_cmds.eq(1)
+            self.comb += req_want_activates.eq(ras_allowed)
             
         # Refresher cmd
         
-        refreshCmd = stream.Endpoint(cmd_request_rw_layout(settings.geom.addressbits, settings.geom.bankbits + log2_int(settings.phy.nranks)))
+        refreshCmd = stream.Endpoint(req_layout)
         
-        self.submodules += TMRInput(refresher.TMRcmd.valid, refreshCmd.valid)
-        self.submodules += TMRInput(refresher.TMRcmd.last, refreshCmd.last)
-        self.submodules += TMROutput(refreshCmd.ready, refresher.TMRcmd.ready)
-        self.submodules += TMRInput(refresher.TMRcmd.first, refreshCmd.first)
-        self.submodules += TMRInput(refresher.TMRcmd.a, refreshCmd.a)
-        self.submodules += TMRInput(refresher.TMRcmd.ba, refreshCmd.ba)
-        self.submodules += TMRInput(refresher.TMRcmd.cas, refreshCmd.cas)
-        self.submodules += TMRInput(refresher.TMRcmd.ras, refreshCmd.ras)
-        self.submodules += TMRInput(refresher.TMRcmd.we, refreshCmd.we)
-        self.submodules += TMRInput(refresher.TMRcmd.is_cmd, refreshCmd.is_cmd)
-        self.submodules += TMRInput(refresher.TMRcmd.is_read, refreshCmd.is_read)
-        self.submodules += TMRInput(refresher.TMRcmd.is_write, refreshCmd.is_write)
+        _connect_TMR_cmd(self, refresher.TMRcmd, refreshCmd)
 
         # Command steering -------------------------------------------------------------------------
         nop = Record(cmd_request_layout(settings.geom.addressbits,
@@ -577,127 +751,114 @@ class Multiplexer(Module, AutoCSR):
         # nop must be 1st
         commands = [nop, choose_cmd_source, choose_req_source, refreshCmd]
         
+        # Compute the valid & ready & attr gates once from the shared command
+        # sources; the three steerer replicas reuse the same signals.
+        steerer_valid_ands = {}
+        for attr in ("cas", "ras", "we", "is_read", "is_write"):
+            gated = []
+            for command in commands:
+                if not hasattr(command, "valid"):
+                    gated.append(0)
+                else:
+                    gate = Signal(name_override="steer_{}_valid".format(attr))
+                    self.comb += gate.eq(command.valid & command.ready & getattr(command, attr))
+                    gated.append(gate)
+            steerer_valid_ands[attr] = gated
+
         #steerer = _Steerer(commands, dfi)
-        steerer_int = _SteererInt(a, ba, settings.phy.nranks, settings.phy.dfi_databits, settings.phy.nphases)
-        steerer_int2 = _SteererInt(a, ba, settings.phy.nranks, settings.phy.dfi_databits, settings.phy.nphases)
-        steerer_int3 = _SteererInt(a, ba, settings.phy.nranks, settings.phy.dfi_databits, settings.phy.nphases)
+        steerer_int, steerer_int2, steerer_int3 = _replicate_TMR(self, "steerer_int", _SteererInt,
+            a, ba, settings.phy.nranks, settings.phy.dfi_databits, settings.phy.nphases,
+            valid_ands=steerer_valid_ands, layout=req_layout, share={"rank_outputs": "rank_outputs"})
         
         #for i, command in enumerate(commands):
         #    self.comb += command.connect(steerer_int.commands[i])
         
-        self.comb += [choose_cmd_source.connect(steerer_int.commands[1], omit={'ready'}),
-                      steerer_int.commands[1].ready.eq(choose_cmd_source.ready),
-                      choose_req_source.connect(steerer_int.commands[2], omit={'ready'}),
-                      steerer_int.commands[2].ready.eq(choose_req_source.ready),
-                      refreshCmd.connect(steerer_int.commands[3], omit={'ready'}),
-                      steerer_int.commands[3].ready.eq(refreshCmd.ready)]
-                      
-        self.comb += [choose_cmd_source.connect(steerer_int2.commands[1], omit={'ready'}),
-                      steerer_int2.commands[1].ready.eq(choose_cmd_source.ready),
-                      choose_req_source.connect(steerer_int2.commands[2], omit={'ready'}),
-                      steerer_int2.commands[2].ready.eq(choose_req_source.ready),
-                      refreshCmd.connect(steerer_int2.commands[3], omit={'ready'}),
-                      steerer_int2.commands[3].ready.eq(refreshCmd.ready)]
-                      
-        self.comb += [choose_cmd_source.connect(steerer_int3.commands[1], omit={'ready'}),
-                      steerer_int3.commands[1].ready.eq(choose_cmd_source.ready),
-                      choose_req_source.connect(steerer_int3.commands[2], omit={'ready'}),
-                      steerer_int3.commands[2].ready.eq(choose_req_source.ready),
-                      refreshCmd.connect(steerer_int3.commands[3], omit={'ready'}),
-                      steerer_int3.commands[3].ready.eq(refreshCmd.ready)]
-        
+        def broadcast(source, sinks):
+            # Fan one command source out to the three steerer replicas. The
+            # FSM drives source.ready directly, so ready is forwarded to the
+            # sinks rather than derived from them (a ready voted back from
+            # the replicas would form a combinational loop with the FSM).
+            eqs = []
+            for sink in sinks:
+                eqs += source.connect(sink, omit={"ready"})
+                eqs.append(sink.ready.eq(source.ready))
+            return eqs
+
+        steerers = [steerer_int, steerer_int2, steerer_int3]
+        self.comb += broadcast(choose_cmd_source, [s.commands[1] for s in steerers])
+        self.comb += broadcast(choose_req_source, [s.commands[2] for s in steerers])
+        self.comb += broadcast(refreshCmd,        [s.commands[3] for s in steerers])
+
         vote_TMR(self, dfi, steerer_int.dfi, steerer_int2.dfi, steerer_int3.dfi, master=True)
         
         #self.comb += [steerer_int.dfi.connect(dfi1),
-                        
-        self.submodules += steerer_int
-
-        # tRRD timing (Row to Row delay) -----------------------------------------------------------
-        self.submodules.trrdcon = trrdcon = tXXDController(settings.timing.tRRD)
-        self.comb += trrdcon.valid.eq(choose_cmd_accept() & choose_cmd_activate())
-
-        self.submodules.trrdcon2 = trrdcon2 = tXXDController(settings.timing.tRRD)
-        self.comb += trrdcon2.valid.eq(choose_cmd_accept() & choose_cmd_activate())
 
-        self.submodules.trrdcon3 = trrdcon3 = tXXDController(settings.timing.tRRD)
-        self.comb += trrdcon3.valid.eq(choose_cmd_accept() & choose_cmd_activate())
+        # The timing controllers take the single (already voted) accept
+        # strobes as input, so replicating whole controllers only protected
+        # their state registers; the TMR controller variants triplicate just
+        # that state internally and vote it every cycle.
 
-        trrdSig = Cat(trrdcon.ready, trrdcon2.ready, trrdcon3.ready)
-        trrdVote = TMRInput(trrdSig)
-        self.submodules += trrdVote
+        # tRRD timing (Row to Row delay) -----------------------------------------------------------
+        self.submodules.trrdcon = trrdcon = tXXDControllerTMR(settings.timing.tRRD)
+        self.comb += trrdcon.valid.eq(choose_cmd_accept() & cmd_is_act)
 
         # tFAW timing (Four Activate Window) -------------------------------------------------------
-        self.submodules.tfawcon = tfawcon = tFAWController(settings.timing.tFAW)
-        self.comb += tfawcon.valid.eq(choose_cmd_accept() & choose_cmd_activate())
-
-        self.submodules.tfawcon2 = tfawcon2 = tFAWController(settings.timing.tFAW)
-        self.comb += tfawcon2.valid.eq(choose_cmd_accept() & choose_cmd_activate())
-
-        self.submodules.tfawcon3 = tfawcon3 = tFAWController(settings.timing.tFAW)
-        self.comb += tfawcon3.valid.eq(choose_cmd_accept() & choose_cmd_activate())
-
-        tfawSig = Cat(tfawcon.ready, tfawcon2.ready, tfawcon3.ready)
-        tfawVote = TMRInput(tfawSig)
-        self.submodules += tfawVote
+        self.submodules.tfawcon = tfawcon = tFAWControllerTMR(settings.timing.tFAW)
+        self.comb += tfawcon.valid.eq(choose_cmd_accept() & cmd_is_act)
 
         # RAS control ------------------------------------------------------------------------------
-        self.comb += ras_allowed.eq(trrdVote.control & tfawVote.control)
+        self.comb += ras_allowed.eq(trrdcon.ready & tfawcon.ready)
 
         # tCCD timing (Column to Column delay) -----------------------------------------------------
-        self.submodules.tccdcon = tccdcon = tXXDController(settings.timing.tCCD)
+        self.submodules.tccdcon = tccdcon = tXXDControllerTMR(settings.timing.tCCD)
         self.comb += tccdcon.valid.eq(choose_req_accept() & (choose_req_write() | choose_req_read()))
 
-        self.submodules.tccdcon2 = tccdcon2 = tXXDController(settings.timing.tCCD)
-        self.comb += tccdcon2.valid.eq(choose_req_accept() & (choose_req_write() | choose_req_read()))
-
-        self.submodules.tccdcon3 = tccdcon3 = tXXDController(settings.timing.tCCD)
-        self.comb += tccdcon3.valid.eq(choose_req_accept() & (choose_req_write() | choose_req_read()))
-
-        tccdSig = Cat(tccdcon.ready, tccdcon2.ready, tccdcon3.ready)
-        tccdVote = TMRInput(tccdSig)
-        self.submodules += tccdVote
-
         # CAS control ------------------------------------------------------------------------------
-        self.comb += cas_allowed.eq(tccdVote.control)
+        self.comb += cas_allowed.eq(tccdcon.ready)
 
         # tWTR timing (Write to Read delay) --------------------------------------------------------
         write_latency = math.ceil(settings.phy.cwl / settings.phy.nphases)
-        self.submodules.twtrcon = twtrcon = tXXDController(
+        self.submodules.twtrcon = twtrcon = tXXDControllerTMR(
             settings.timing.tWTR + write_latency +
             # tCCD must be added since tWTR begins after the transfer is complete
             settings.timing.tCCD if settings.timing.tCCD is not None else 0)
         self.comb += twtrcon.valid.eq(choose_req_accept() & choose_req_write())
 
-        self.submodules.twtrcon2 = twtrcon2 = tXXDController(
-            settings.timing.tWTR + write_latency +
-            settings.timing.tCCD if settings.timing.tCCD is not None else 0)
-        self.comb += twtrcon2.valid.eq(choose_req_accept() & choose_req_write())
-
-        self.submodules.twtrcon3 = twtrcon3 = tXXDController(
-            settings.timing.tWTR + write_latency +
-            settings.timing.tCCD if settings.timing.tCCD is not None else 0)
-        self.comb += twtrcon3.valid.eq(choose_req_accept() & choose_req_write())
-
-        twtrSig = Cat(twtrcon.ready, twtrcon2.ready, twtrcon3.ready)
-        twtrVote = TMRInput(twtrSig)
-        self.submodules += twtrVote
-
         # Read/write turnaround --------------------------------------------------------------------
         read_available = Signal()
         write_available = Signal()
-        reads = [req.valid & req.is_read for req in requests]
-        writes = [req.valid & req.is_write for req in requests]
-        self.comb += [
-            read_available.eq(reduce(or_, reads)),
-            write_available.eq(reduce(or_, writes))
-        ]
+        # Materialise the valid & is_read/is_write gates once per request;
+        # the availability reductions and the watermark popcounts below all
+        # share these signals instead of re-emitting the AND per consumer.
+        # (The chooser valids keep their equality form: they match is_read
+        # against want_reads, which is not the same function.)
+        reads  = [Signal() for req in requests]
+        writes = [Signal() for req in requests]
+        self.comb += [r.eq(req.valid & req.is_read)  for r, req in zip(reads,  requests)]
+        self.comb += [w.eq(req.valid & req.is_write) for w, req in zip(writes, requests)]
+        # Availability is derived from the watermark popcounts computed
+        # below (>=1 is just popcount != 0), so the separate OR trees are
+        # gone and the prefix adder tree serves both threshold tests.
+
 
         # Anti Starvation --------------------------------------------------------------------------
 
         def anti_starvation(timeout):
             en = Signal()
             max_time = Signal()
-            if timeout:
+            if timeout and timeout <= 64:
+                # One-hot token shifted once per enabled cycle; max_time is
+                # just the MSB tap, replacing the subtract + compare-to-zero
+                # cone in the FSM transition guards.
+                token = Signal(timeout, reset=1)
+                self.comb += max_time.eq(token[-1])
+                self.sync += If(~en,
+                        token.eq(1)
+                    ).Elif(~max_time,
+                        token.eq(token << 1)
+                    )
+            elif timeout:
+                # Too long for a one-hot register; keep the down-counter.
                 t = timeout - 1
                 time = Signal(max=t+1)
                 self.comb += max_time.eq(time == 0)
@@ -713,56 +874,125 @@ class Multiplexer(Module, AutoCSR):
         read_time_en,   max_read_time = anti_starvation(settings.read_time)
         write_time_en, max_write_time = anti_starvation(settings.write_time)
 
+        # Watermark hysteresis: every R<->W flip pays the RTW/WTR bubbles,
+        # so a direction switch is deferred until enough opposite-direction
+        # requests are pending (programmable at runtime; resets come from
+        # the controller settings). Starvation timers still force the flip.
+        nreqs_bits = bits_for(len(requests))
+        self._write_watermark = CSRStorage(nreqs_bits, reset=settings.write_hi_watermark,
+            name="write_watermark")
+        self._read_watermark  = CSRStorage(nreqs_bits, reset=settings.read_drain_hi,
+            name="read_watermark")
+        npending_reads  = Signal(nreqs_bits)
+        npending_writes = Signal(nreqs_bits)
+        self.comb += [
+            npending_reads.eq(tree_reduce(add, reads)),
+            npending_writes.eq(tree_reduce(add, writes)),
+            read_available.eq(npending_reads != 0),
+            write_available.eq(npending_writes != 0)
+        ]
+        write_pressure = Signal()
+        read_pressure  = Signal()
+        write_drained  = Signal()
+        self.comb += [
+            write_pressure.eq(npending_writes >= self._write_watermark.storage),
+            read_pressure.eq(npending_reads >= self._read_watermark.storage),
+            # Low watermark: stay in WRITE until the queue drains below it.
+            # Clamped to 1 so an empty write queue always releases the bus.
+            write_drained.eq(npending_writes < max(settings.write_lo_watermark, 1))
+        ]
+
         # Refresh ----------------------------------------------------------------------------------
-        self.comb += [bm.refresh_req.eq(refreshCmd.valid) for bm in bank_machines]
+        # Registered broadcast: refresh_req fans out to every bank machine
+        # and changes rarely, so cutting the net with a register costs one
+        # cycle that the multi-cycle refresh_gnt handshake absorbs anyway.
+        refresh_req_r = Signal()
+        self.sync += refresh_req_r.eq(refreshCmd.valid)
+        self.comb += [bm.refresh_req.eq(refresh_req_r) for bm in bank_machines]
+        # go_to_refresh is registered and only evaluated while a refresh is
+        # actually pending; the grant AND tree then stays out of the READ/
+        # WRITE transition guards, and the extra cycle is absorbed by the
+        # multi-cycle refresh handshake.
         go_to_refresh = Signal()
         bm_refresh_gnts = [bm.refresh_gnt for bm in bank_machines]
-        self.comb += go_to_refresh.eq(reduce(and_, bm_refresh_gnts))
+        self.sync += If(refreshCmd.valid,
+                go_to_refresh.eq(tree_reduce_signals(self, and_, bm_refresh_gnts))
+            ).Else(
+                go_to_refresh.eq(0)
+            )
 
         # Datapath ---------------------------------------------------------------------------------
-        all_rddata = [p.rddata for p in dfi.phases]
-        all_wrdata = [p.wrdata for p in dfi.phases]
-        all_wrdata_mask = [p.wrdata_mask for p in dfi.phases]        
-        self.submodules += TMROutput(Cat(*all_rddata), TMRinterface.rdata)
-        self.submodules += TMRInput(TMRinterface.wdata, Cat(*all_wrdata))
-        self.submodules += TMRInput(~TMRinterface.wdata_we, Cat(*all_wrdata_mask))
-
-        def steerer_sel(steerer, access):
+        # One voter/replicator per phase instead of a single monolithic
+        # instance over the concatenated bus: each is only one phase wide,
+        # so synthesis can keep the vote logic next to its phase. The TMR
+        # buses are copy-major, so a phase's three copies are gathered from
+        # the matching slice of each copy.
+        def tmr_phase_slice(tmr_sig, i, width):
+            copy = len(tmr_sig)//3
+            return Cat(*[tmr_sig[n*copy + i*width : n*copy + (i+1)*width]
+                         for n in range(3)])
+
+        rd_width   = len(dfi.phases[0].rddata)
+        wr_width   = len(dfi.phases[0].wrdata)
+        mask_width = len(dfi.phases[0].wrdata_mask)
+        for i, phase in enumerate(dfi.phases):
+            self.submodules += TMROutput(phase.rddata,
+                tmr_phase_slice(TMRinterface.rdata, i, rd_width))
+            self.submodules += TMRInput(
+                tmr_phase_slice(TMRinterface.wdata, i, wr_width), phase.wrdata)
+            self.submodules += TMRInput(
+                ~tmr_phase_slice(TMRinterface.wdata_we, i, mask_width), phase.wrdata_mask)
+
+        def phase_sel(access, i, sel):
             assert access in ["read", "write"]
-            r = []
-            for i in range(nphases):
-                r.append(steerer.sel[i].eq(STEER_NOP))
-                if access == "read":
-                    r.append(If(i == rdphase,    steerer.sel[i].eq(STEER_REQ)))
-                    r.append(If(i == rdcmdphase, steerer.sel[i].eq(STEER_CMD)))
-                if access == "write":
-                    r.append(If(i == wrphase,    steerer.sel[i].eq(STEER_REQ)))
-                    r.append(If(i == wrcmdphase, steerer.sel[i].eq(STEER_CMD)))
+            r = [sel.eq(STEER_NOP)]
+            if access == "read":
+                r.append(If(i == rdphase,    sel.eq(STEER_REQ)))
+                r.append(If(i == rdcmdphase, sel.eq(STEER_CMD)))
+            if access == "write":
+                r.append(If(i == wrphase,    sel.eq(STEER_REQ)))
+                r.append(If(i == wrcmdphase, sel.eq(STEER_CMD)))
             return r
 
+        # The steerer replicas are TMR copies of the same logic, so the
+        # per-state phase decode is computed once on shared sel signals and
+        # broadcast to all three, instead of re-emitting the comparator
+        # trees per replica inside every FSM state (see below, after the
+        # FSM is defined so fsm.ongoing() is available).
+        steerer_sels = [Signal(max=4) for i in range(nphases)]
+
+        # Read-to-write turnaround: a single RTW state with a loadable
+        # down-counter instead of delayed_enter's chain of read_latency-1
+        # anonymous states; the FSM encoding stays small and every
+        # next-state mux gets shallower. The dwell time is unchanged:
+        # max(read_latency-1, 1) cycles.
+        # TODO: reduce this, actual limit is around (cl+1)/nphases
+        rtw_delay = max(settings.phy.read_latency - 2, 0)
+        rtw_cnt   = Signal(max=rtw_delay + 1)
+
+        # nphases is an elaboration-time constant, so the single/multi-phase
+        # command-issue policy is chosen with a plain Python if instead of a
+        # migen If whose dead branch would still be built into each state.
+        if settings.phy.nphases == 1:
+            def issue_ready():
+                return [choose_req_source.ready.eq(cas_allowed & (~req_is_act | ras_allowed))]
+        else:
+            def issue_ready():
+                return [
+                    choose_cmd_source.ready.eq(~cmd_is_act | ras_allowed),
+                    choose_req_source.ready.eq(cas_allowed)
+                ]
+
         # Control FSM ------------------------------------------------------------------------------
         self.submodules.fsm = fsm = FSM()
         fsm.act("READ",
             fsm_state.eq(0),
             read_time_en.eq(1),
-            choose_req_int.want_reads.eq(1),
-            choose_req_int2.want_reads.eq(1),
-            choose_req_int3.want_reads.eq(1),
-            If(settings.phy.nphases == 1,
-                choose_req_source.ready.eq(cas_allowed & (~choose_req_activate() | ras_allowed))
-            ).Else(
-                choose_cmd_int.want_activates.eq(ras_allowed),
-                choose_cmd_int2.want_activates.eq(ras_allowed),
-                choose_cmd_int3.want_activates.eq(ras_allowed),
-                choose_cmd_source.ready.eq(~choose_cmd_activate() | ras_allowed),
-                choose_req_source.ready.eq(cas_allowed)
-            ),
-            steerer_sel(steerer_int, access="read"),
-            steerer_sel(steerer_int2, access="read"),
-            steerer_sel(steerer_int3, access="read"),
+            req_want_reads.eq(1),
+            *issue_ready(),
             If(write_available,
-                # TODO: switch only after several cycles of ~read_available?
-                If(~read_available | max_read_time,
+                If(~read_available | max_read_time | write_pressure,
+                    NextValue(rtw_cnt, rtw_delay),
                     NextState("RTW")
                 )
             ),
@@ -773,23 +1003,10 @@ class Multiplexer(Module, AutoCSR):
         fsm.act("WRITE",
             fsm_state.eq(1),
             write_time_en.eq(1),
-            choose_req_int.want_writes.eq(1),
-            choose_req_int2.want_writes.eq(1),
-            choose_req_int3.want_writes.eq(1),
-            If(settings.phy.nphases == 1,
-                choose_req_source.ready.eq(cas_allowed & (~choose_req_activate() | ras_allowed))
-            ).Else(
-                choose_cmd_int.want_activates.eq(ras_allowed),
-                choose_cmd_int2.want_activates.eq(ras_allowed),
-                choose_cmd_int3.want_activates.eq(ras_allowed),
-                choose_cmd_source.ready.eq(~choose_cmd_activate() | ras_allowed),
-                choose_req_source.ready.eq(cas_allowed)
-            ),
-            steerer_sel(steerer_int, access="write"),
-            steerer_sel(steerer_int2, access="write"),
-            steerer_sel(steerer_int3, access="write"),
+            req_want_writes.eq(1),
+            *issue_ready(),
             If(read_available,
-                If(~write_available | max_write_time,
+                If(write_drained | max_write_time | read_pressure,
                     NextState("WTR")
                 )
             ),
@@ -799,22 +1016,84 @@ class Multiplexer(Module, AutoCSR):
         )
         fsm.act("REFRESH",
             fsm_state.eq(2),
-            steerer_int.sel[0].eq(STEER_REFRESH),
-            steerer_int2.sel[0].eq(STEER_REFRESH),
-            steerer_int3.sel[0].eq(STEER_REFRESH),
             refreshCmd.ready.eq(1),
+            # Resume on the side that actually has traffic: going back to
+            # READ with only writes pending would just bounce through RTW.
             If(refreshCmd.last,
-                NextState("READ")
+                If(~read_available & write_available,
+                    NextState("WRITE")
+                ).Else(
+                    NextState("READ")
+                )
             )
         )
+        # A refresh queued during turnaround is taken as soon as the
+        # turnaround time has elapsed, instead of first sitting through a
+        # full WRITE/READ pass.
         fsm.act("WTR",
-            If(twtrVote.control,
-                NextState("READ")
+            If(twtrcon.ready,
+                If(go_to_refresh,
+                    NextState("REFRESH")
+                ).Else(
+                    NextState("READ")
+                )
             )
         )
-        # TODO: reduce this, actual limit is around (cl+1)/nphases
-        fsm.delayed_enter("RTW", "WRITE", settings.phy.read_latency-1)
+        fsm.act("RTW",
+            If(rtw_cnt == 0,
+                If(go_to_refresh,
+                    NextState("REFRESH")
+                ).Else(
+                    NextState("WRITE")
+                )
+            ).Else(
+                NextValue(rtw_cnt, rtw_cnt - 1)
+            )
+        )
+
+        # want_activates is identical in READ and WRITE; drive it once here
+        # instead of per-state so the FSM output logic stays a plain state
+        # decode (ras_allowed has a large fanout already).
+        if settings.phy.nphases > 1:
+            self.comb += cmd_want_activates.eq(
+                ras_allowed & (fsm.ongoing("READ") | fsm.ongoing("WRITE")))
+
+        # Shared steerer select decode (NOP by default, e.g. in RTW/WTR).
+        # With constant phase assignments - the common case - each phase's
+        # select collapses at elaboration time to a fixed value per state,
+        # so only the non-NOP branches are emitted; the cmdphase checks come
+        # last to preserve the If-chain precedence of the signal form.
+        phases_const = all(isinstance(ph, int)
+                           for ph in (rdphase, rdcmdphase, wrphase, wrcmdphase))
+        for i, sel in enumerate(steerer_sels):
+            body = None
+            if phases_const:
+                read_val  = (STEER_CMD if i == rdcmdphase else
+                             STEER_REQ if i == rdphase    else STEER_NOP)
+                write_val = (STEER_CMD if i == wrcmdphase else
+                             STEER_REQ if i == wrphase    else STEER_NOP)
+                for cond, val in ((fsm.ongoing("READ"),  read_val),
+                                  (fsm.ongoing("WRITE"), write_val)):
+                    if val == STEER_NOP:
+                        continue
+                    body = If(cond, sel.eq(val)) if body is None                         else body.Elif(cond, sel.eq(val))
+            else:
+                body = If(fsm.ongoing("READ"),
+                    *phase_sel("read", i, sel)
+                ).Elif(fsm.ongoing("WRITE"),
+                    *phase_sel("write", i, sel)
+                )
+            if i == 0: # Refresh commands are steered on phase 0
+                refresh = [fsm.ongoing("REFRESH"), sel.eq(STEER_REFRESH)]
+                body = If(*refresh) if body is None else body.Elif(*refresh)
+            if body is not None:
+                self.comb += body
+        for steerer in steerers:
+            self.comb += [steerer.sel[i].eq(sel) for i, sel in enumerate(steerer_sels)]
 
         if settings.with_bandwidth:
             data_width = settings.phy.dfi_databits*settings.phy.nphases
-            self.submodules.bandwidth = Bandwidth(self.choose_req.cmd, data_width)
+            # Monitor the single voted request chooser; Bandwidth only
+            # samples the narrow valid/ready/is_read/is_write bits of the
+            # endpoint, so one monitor covers all TMR copies.
+            self.submodules.bandwidth = Bandwidth(choose_req_source, data_width)
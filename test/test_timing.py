@@ -9,7 +9,7 @@ import random
 
 from migen import *
 
-from litedram.common import tXXDController, tFAWController
+from litedram.common import tXXDController, tXXDControllerTMR, tFAWController, tFAWControllerTMR
 
 
 def c2bool(c):
@@ -17,7 +17,7 @@ def c2bool(c):
 
 
 class TestTiming(unittest.TestCase):
-    def txxd_controller_test(self, txxd, valids, readys):
+    def txxd_controller_test(self, txxd, valids, readys, cls=tXXDController):
         def generator(dut):
             dut.errors = 0
             for valid, ready in zip(valids, readys):
@@ -26,7 +26,7 @@ class TestTiming(unittest.TestCase):
                 if (yield dut.ready) != c2bool(ready):
                     dut.errors += 1
 
-        dut = tXXDController(txxd)
+        dut = cls(txxd)
         run_simulation(dut, [generator(dut)])
         self.assertEqual(dut.errors, 0)
 
@@ -51,7 +51,17 @@ class TestTiming(unittest.TestCase):
         readys = "___--___---"
         self.txxd_controller_test(txxd, valids, readys)
 
-    def txxd_controller_random_test(self, txxd, loops):
+    def test_txxd_controller_tmr(self):
+        # The TMR variant must behave identically to tXXDController
+        for txxd, valids, readys in [
+            (1, "__-______",   "_--------"),
+            (2, "__-______",   "_--_-----"),
+            (3, "____-______", "___--__----"),
+            (4, "____-______", "___--___---")]:
+            with self.subTest(txxd=txxd):
+                self.txxd_controller_test(txxd, valids, readys, cls=tXXDControllerTMR)
+
+    def txxd_controller_random_test(self, txxd, loops, cls=tXXDController):
         def generator(dut, valid_rand):
             prng = random.Random(42)
             for l in range(loops):
@@ -73,7 +83,7 @@ class TestTiming(unittest.TestCase):
                     yield
                 dut.ready_gaps.append(ready_gap)
 
-        dut = tXXDController(txxd)
+        dut = cls(txxd)
         run_simulation(dut, [generator(dut, valid_rand=90), checker(dut)])
         self.assertEqual(min(dut.ready_gaps), txxd)
 
@@ -82,8 +92,13 @@ class TestTiming(unittest.TestCase):
             with self.subTest(txxd=txxd):
                 self.txxd_controller_random_test(txxd, 512)
 
+    def test_txxd_controller_tmr_random(self):
+        for txxd in range(2, 32):
+            with self.subTest(txxd=txxd):
+                self.txxd_controller_random_test(txxd, 512, cls=tXXDControllerTMR)
 
-    def tfaw_controller_test(self, txxd, valids, readys):
+
+    def tfaw_controller_test(self, txxd, valids, readys, cls=tFAWController):
         def generator(dut):
             dut.errors = 0
             for valid, ready in zip(valids, readys):
@@ -92,7 +107,7 @@ class TestTiming(unittest.TestCase):
                 if (yield dut.ready) != c2bool(ready):
                     dut.errors += 1
 
-        dut = tFAWController(txxd)
+        dut = cls(txxd)
         run_simulation(dut, [generator(dut)])
         self.assertEqual(dut.errors, 0)
 
@@ -120,3 +135,14 @@ class TestTiming(unittest.TestCase):
         readys = "-----------------"
         with self.subTest(tfaw=tfaw, valids=valids, readys=readys):
             self.tfaw_controller_test(tfaw, valids, readys)
+
+    def test_tfaw_controller_tmr(self):
+        # The TMR variant must behave identically to tFAWController
+        tfaw = 8
+        for valids, readys in [
+            ("_----___________",  "-----______-----"),
+            ("_-_-_-_-________",  "--------___-----"),
+            ("_-_-___-_-______",  "----------_-----"),
+            ("_-_-____-_-______", "-----------------")]:
+            with self.subTest(tfaw=tfaw, valids=valids, readys=readys):
+                self.tfaw_controller_test(tfaw, valids, readys, cls=tFAWControllerTMR)